@@ -0,0 +1,281 @@
+# Performance benchmarks for the acquisition and motion stack, runnable on Linux without hardware.
+# Serial devices are simulated on pseudo-terminals; DVT_COM.dll is replaced by a CRC stand-in.
+import argparse, binascii, contextlib, fnmatch, io, json, os, pathlib, platform, sys, threading, time, tty
+from typing import Callable, Dict, Optional, Tuple
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / "src" / "python_64"), str(ROOT / "src" / "python_32")]
+
+import clock
+from viscometer_protocol import ViscometerProtocol
+from viscometer_client import ViscometerClient
+from cnc_controller import CNC_Machine
+import cell_sim
+
+BASELINE_FILE     = pathlib.Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.25   # a metric more than 25% above its baseline is a regression
+DEFAULT_REPEAT    = 5      # each timing is the best (minimum) of this many runs
+# Allowed slowdown per metric (fnmatch patterns, first match wins), stored with each baseline value.
+# Subprocess and pty round trips depend on scheduler wake-ups and need more room than pure-Python code;
+# the simulated times are deterministic, so any increase is a regression.
+METRIC_THRESHOLDS = (
+    ("cycle.sim_cycle_time", 0.0),
+    ("cycle.sim_makespan", 0.0),
+    ("worker.*", 0.6),
+    ("protocol_serial.*", 0.6),
+    ("cnc.gcode_stream_*", 0.6),
+    ("*", DEFAULT_THRESHOLD),
+)
+STANDIN_DLL       = "bench:crc-standin"
+
+class CrcStandIn:
+    # Same calls as DVT_COM.dll with CRC-CCITT (binascii.crc_hqx) as 4 hex digits; for timing only,
+    # the device's real CRC format is not reproduced
+    @staticmethod
+    def add(text: str) -> str:
+        return text + f"{binascii.crc_hqx(text.encode('ascii'), 0):04X}"
+
+    @staticmethod
+    def strip(text: str) -> str:
+        body, crc = text[:-4], text[-4:]
+        return body if len(text) > 4 and CrcStandIn.add(body)[-4:] == crc else ""
+
+    @staticmethod
+    def AddCRCToString(out, src):
+        out.value = CrcStandIn.add(src.value)
+
+    @staticmethod
+    def CheckCRCAndRemove(out, src):
+        out.value = CrcStandIn.strip(src.value.strip())
+
+class _Pty:
+    # Pseudo-terminal pair: the benchmark talks to .name through pyserial, a thread plays the device on .master.
+    # The slave fd is held open so reads on the master never see EIO before pyserial has opened it.
+    def __init__(self):
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.name = os.ttyname(self._slave)
+
+    def close(self):
+        os.close(self.master)
+        os.close(self._slave)
+
+def _serve_lines(fd: int, sep: bytes, reply: Callable[[str], str]):
+    # Device side of a pty: answer each line; ends when the master is closed
+    def _run():
+        buf = b""
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data
+            while sep in buf:
+                line, buf = buf.split(sep, 1)
+                out = reply(line.decode("ascii", errors="ignore"))
+                if out:
+                    try:
+                        os.write(fd, out.encode("ascii"))
+                    except OSError:
+                        return
+    threading.Thread(target=_run, daemon=True).start()
+
+def _viscometer_reply():
+    rec = [0]
+
+    def reply(line: str) -> str:
+        cmd = CrcStandIn.strip(line.strip())
+        if not cmd:
+            return ""
+        if cmd.startswith("R"):
+            rec[0] = (rec[0] + 1) & 0xFFFF
+            body = f"R{rec[0]:04X}{2500:04X}{12500:04X}00"  # 25.00 % torque, 25.00 °C
+        elif cmd.startswith("I"):
+            body = "I00010A01020300"
+        else:
+            body = cmd[0] + "00"
+        return CrcStandIn.add(body) + "\r"
+    return reply
+
+def _grbl_reply(line: str) -> str:
+    # GRBL answers '?' with a status report; every line (including the empty one after '?') gets "ok"
+    line = line.strip()
+    if line.startswith("?"):
+        return "<Idle|MPos:0.000,0.000,0.000|FS:0,0>\r\nok\r\n"
+    return "ok\r\n"
+
+def _timed(fn: Callable[[], None], n: int, repeat: int) -> float:
+    # Seconds per call, best of repeat runs: interference only ever makes a run slower
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        runs.append((time.perf_counter() - t0) / n)
+    return min(runs)
+
+# Benchmarks: each returns {metric: (value, unit)}, lower is better
+def bench_parse(repeat: int) -> Dict[str, Tuple[float, str]]:
+    lines = [f"R{i:04X}{(i * 37) % 10000:04X}{12000 + i % 500:04X}{i % 2:02X}" for i in range(1000)]
+    it = iter(lines * 1000)
+    per = _timed(lambda: ViscometerProtocol.parse_data_response(next(it)), 20000, repeat)
+    return {"parse_data_response": (per * 1e6, "us/op")}
+
+def bench_crc(repeat: int) -> Dict[str, Tuple[float, str]]:
+    ViscometerProtocol._DLL_CACHE[STANDIN_DLL] = CrcStandIn
+    proto = ViscometerProtocol(dll_path=STANDIN_DLL)
+    framed = proto._add_crc("R0001000A30D400")
+    return {
+        "add_crc": (_timed(lambda: proto._add_crc("V0C80"), 20000, repeat) * 1e6, "us/op"),
+        "remove_crc": (_timed(lambda: proto._remove_crc(framed), 20000, repeat) * 1e6, "us/op"),
+    }
+
+def bench_protocol_serial(repeat: int) -> Dict[str, Tuple[float, str]]:
+    # Full command path: CRC framing, serial write, device reply, read_until, CRC check, parse
+    ViscometerProtocol._DLL_CACHE[STANDIN_DLL] = CrcStandIn
+    pty = _Pty()
+    _serve_lines(pty.master, b"\r", _viscometer_reply())
+    proto = ViscometerProtocol(port=pty.name, dll_path=STANDIN_DLL, timeout_s=1.0)
+    try:
+        proto.connect()
+        proto.set_speed(10.0)
+        assert proto.read_single_point()["torque_valid"]
+        per = _timed(proto.read_single_point, 200, repeat)
+    finally:
+        proto.close()
+        pty.close()
+    return {"read_single_point_pty": (per * 1e3, "ms/op")}
+
+def bench_worker(repeat: int) -> Dict[str, Tuple[float, str]]:
+    # JSON-lines round trip through a real worker32.py subprocess ('status' needs neither DLL nor device)
+    worker = ROOT / "src" / "python_32" / "worker32.py"
+    spawn = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        c = ViscometerClient(sys.executable, worker)
+        c.status()
+        spawn.append(time.perf_counter() - t0)
+        c.close()
+    c = ViscometerClient(sys.executable, worker)
+    try:
+        per = _timed(c.status, 500, repeat)
+    finally:
+        c.close()
+    return {"worker_spawn_first_status": (min(spawn) * 1e3, "ms"),
+            "worker_status_roundtrip": (per * 1e6, "us/op")}
+
+class BenchCNC(CNC_Machine):
+    LOCATION_FILE = str(ROOT / "config" / "locations.yaml")
+
+def bench_cnc(repeat: int) -> Dict[str, Tuple[float, str]]:
+    with contextlib.redirect_stdout(io.StringIO()):  # the controller prints on connect and per chunk
+        cnc = BenchCNC(virtual=False)
+    def _build():
+        x, y, z = cnc.get_location_position("main_rack_A", 2)
+        cnc._gcode_to(z=cnc.Z_HIGH_BOUND) + cnc._gcode_to(x=x, y=y, z=cnc.Z_HIGH_BOUND) + cnc._gcode_to(z=z)
+    gen = _timed(_build, 20000, repeat)
+
+    # Streaming a 60-line program (3 buffered chunks) to a simulated GRBL. The fixed wake/idle
+    # sleeps run on a virtual clock, so this measures the serial exchange itself.
+    program = "".join(cnc._gcode_to(x=10 + i, y=20 + i, z=-5) for i in range(60))
+    pty = _Pty()
+    _serve_lines(pty.master, b"\n", _grbl_reply)
+    cnc.SERIAL_PORT = pty.name
+    prev = clock.set_clock(cell_sim.VirtualClock())
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            stream = _timed(lambda: cnc.follow_gcode_path(program), 10, repeat)
+    finally:
+        clock.set_clock(prev)
+        pty.close()
+    return {"gcode_safe_move_build": (gen * 1e6, "us/op"), "gcode_stream_60_lines": (stream * 1e3, "ms/op")}
+
+def bench_cycle(repeat: int) -> Dict[str, Tuple[float, str]]:
+    # End-to-end sample cycle in virtual time; the simulated cycle time is deterministic and is
+    # checked too, so workflow changes that lengthen a cycle show up as regressions
+    wall, report = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        report = cell_sim.simulate(samples=3, mode="single", wash=True)
+        wall.append(time.perf_counter() - t0)
+    return {"sim_3_samples_wall": (min(wall), "s"),
+            "sim_cycle_time": (report["cycle_s"], "s (virtual)"),
+            "sim_makespan": (report["makespan_s"], "s (virtual)")}
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "crc": bench_crc,
+    "protocol_serial": bench_protocol_serial,
+    "worker": bench_worker,
+    "cnc": bench_cnc,
+    "cycle": bench_cycle,
+}
+
+def run(names, repeat: int) -> Dict[str, Dict[str, object]]:
+    results = {}
+    for name in names:
+        for metric, (value, unit) in BENCHMARKS[name](repeat).items():
+            key = f"{name}.{metric}"
+            results[key] = {"value": round(value, 4), "unit": unit, "threshold": metric_threshold(key)}
+            print(f"  {name + '.' + metric:<40} {value:12.3f} {unit}")
+    return results
+
+def metric_threshold(key: str) -> float:
+    return next(t for pattern, t in METRIC_THRESHOLDS if fnmatch.fnmatch(key, pattern))
+
+def compare(results, baseline, override: Optional[float] = None) -> list:
+    # Metrics above their baseline value by more than the baseline's threshold for them;
+    # override replaces the thresholds of timing metrics (exact ones stay exact)
+    bad = []
+    for key, r in results.items():
+        base = baseline.get("results", {}).get(key)
+        if not base or base["value"] <= 0:
+            continue
+        threshold = base.get("threshold", metric_threshold(key))
+        if override is not None and threshold > 0:
+            threshold = override
+        if r["value"] > base["value"] * (1.0 + threshold):
+            bad.append((key, base["value"], r["value"], r["unit"], threshold))
+    return bad
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark the acquisition and motion stack")
+    ap.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    ap.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", default=str(BASELINE_FILE))
+    ap.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    ap.add_argument("--threshold", type=float,
+                    help="allowed slowdown vs baseline as a fraction, for all timing metrics "
+                         "(default: per metric, as stored in the baseline)")
+    a = ap.parse_args()
+    unknown = [n for n in a.names if n not in BENCHMARKS]
+    if unknown:
+        ap.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    print(f"[BENCH] python {platform.python_version()} on {platform.platform()}")
+    doc = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "machine": platform.machine(), "repeat": a.repeat, "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": run(a.names or list(BENCHMARKS), a.repeat),
+    }
+    if a.out:
+        pathlib.Path(a.out).write_text(json.dumps(doc, indent=2) + "\n", encoding="utf-8")
+    baseline_path = pathlib.Path(a.baseline)
+    if a.save_baseline:
+        # keep metrics of benchmarks that were not run this time
+        old = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {"results": {}}
+        doc["results"] = {**old.get("results", {}), **doc["results"]}
+        baseline_path.write_text(json.dumps(doc, indent=2) + "\n", encoding="utf-8")
+        print(f"[BENCH] baseline saved -> {baseline_path}")
+    elif baseline_path.exists():
+        bad = compare(doc["results"], json.loads(baseline_path.read_text(encoding="utf-8")), a.threshold)
+        for key, base, now, unit, threshold in bad:
+            print(f"[BENCH REGRESSION] {key}: {now:.3f} {unit} vs baseline {base:.3f} "
+                  f"(+{now / base - 1:.0%}, allowed {threshold:.0%})")
+        print(f"[BENCH] {len(bad)} regression(s)")
+        sys.exit(1 if bad else 0)
+    else:
+        print(f"[BENCH] no baseline at {baseline_path}; run with --save-baseline to create one")
@@ -13,6 +13,7 @@ SPINDLE_K  = 992.47   # spindle constant for viscosity calculation
 
 class ViscometerProtocol:
     _INVALID_16 = {0xFFFF, 0xFFFE, 0xFFFD}  # Sentinels & simple sanity for torque/temp fields
+    _DLL_CACHE: Dict[str, Any] = {}          # loaded once per process; lets a standby worker preload it
 
     def __init__(
         self,
@@ -32,14 +33,22 @@ class ViscometerProtocol:
         self._stream_thread: Optional[threading.Thread] = None
         self._current_rpm: float = 0.0
 
+        self._dll = self.load_dll(dll_path)
+
+    @classmethod
+    def load_dll(cls, dll_path: Optional[str] = None):
         # Load DLL (defaults to DVT_COM.dll)
         if dll_path is None:
             dll_path = os.path.join(os.path.dirname(__file__), "DVT_COM.dll")
-        self._dll = ctypes.WinDLL(dll_path)
-        self._dll.AddCRCToString.argtypes = [c_wchar_p, c_wchar_p]
-        self._dll.AddCRCToString.restype = None
-        self._dll.CheckCRCAndRemove.argtypes = [c_wchar_p, c_wchar_p]
-        self._dll.CheckCRCAndRemove.restype = None
+        dll = cls._DLL_CACHE.get(dll_path)
+        if dll is None:
+            dll = ctypes.WinDLL(dll_path)
+            dll.AddCRCToString.argtypes = [c_wchar_p, c_wchar_p]
+            dll.AddCRCToString.restype = None
+            dll.CheckCRCAndRemove.argtypes = [c_wchar_p, c_wchar_p]
+            dll.CheckCRCAndRemove.restype = None
+            cls._DLL_CACHE[dll_path] = dll
+        return dll
 
     # Connection
     def connect(self):
@@ -60,6 +60,11 @@ def cmd_init(i, msg):
         pass
     return ok(i, data={"proto": PROTO_VERSION, "identify_raw": raw, "port": port, "baud": baud})
 
+def cmd_warm(i, _msg):
+    # Standby workers preload the DLL so a failover only has to open the serial port
+    ViscometerProtocol.load_dll()
+    return ok(i, data={"proto": PROTO_VERSION, "warm": True})
+
 def cmd_status(i, _msg):
     return ok(i, data={
         "opened": STATE.opened,
@@ -112,6 +117,7 @@ def cmd_quit(i, _msg):
 
 HANDLERS = {
     "init": cmd_init,
+    "warm": cmd_warm,
     "status": cmd_status,
     "identify": cmd_identify,
     "zero": cmd_zero,
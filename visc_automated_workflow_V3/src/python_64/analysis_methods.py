@@ -1,11 +1,28 @@
 # Analysis methods that use the 64-bit ViscometerClient
-import csv, time, pathlib
-from typing import List
+import csv, pathlib
+from typing import List, Optional
 from viscometer_client import ViscometerClient
+from measurement_qc import QCMonitor, QC_POLL_SEC
+import clock
+
+def _dwell(client: ViscometerClient, seconds: float, rpm: float, qc: Optional[QCMonitor], ignore=()):
+    # Plain wait without QC; with QC, poll packets during the wait so faults surface within seconds
+    if qc is None:
+        clock.sleep(seconds, "measure")
+        return
+    end = clock.now() + seconds
+    while clock.now() < end:
+        try:
+            pkt = client.read_single(timeout=1.0)
+        except RuntimeError:  # a missed packet must not end a dwell that used to be a plain sleep
+            pkt = None
+        qc.check(pkt, rpm, ignore=ignore)
+        clock.sleep(max(min(QC_POLL_SEC, end - clock.now()), 0.0), "measure")
 
 # SINGLE RPM — spin for a duration and sample periodically; write time-series CSV
-def run_single_rpm(results_dir: pathlib.Path, client: ViscometerClient):
-    RPM                = 32
+def run_single_rpm(results_dir: pathlib.Path, client: ViscometerClient, qc: Optional[QCMonitor] = None,
+                   rpm_scale: float = 1.0):
+    RPM                = 32 * rpm_scale
     TOTAL_SECONDS      = 180
     SAMPLE_EVERY_SEC   = 1
     SETTLE_SECONDS     = 1.0
@@ -13,48 +30,56 @@ def run_single_rpm(results_dir: pathlib.Path, client: ViscometerClient):
 
     out = results_dir / CSV_NAME
     out.parent.mkdir(parents=True, exist_ok=True)
-    client.set_speed(RPM)
-    time.sleep(SETTLE_SECONDS)
-    t0 = time.time()
-    next_t = t0 + SAMPLE_EVERY_SEC
-    rows = []
+    partial = out.with_name(out.name + ".partial")  # renamed when complete, deleted if the attempt fails
+    if qc:
+        qc.begin(SETTLE_SECONDS + TOTAL_SECONDS)
+    try:
+        with partial.open("w", newline="", encoding="utf-8") as f: # rows are streamed, not held in memory
+            w = csv.DictWriter(f, fieldnames=[
+                "t_elapsed_s","rpm","torque_percent","torque_valid",
+                "temperature_c","temp_valid","viscosity_cp","status","record"
+            ])
+            w.writeheader()
+            client.set_speed(RPM)
+            clock.sleep(SETTLE_SECONDS, "measure")
+            t0 = clock.now()
+            next_t = t0 + SAMPLE_EVERY_SEC
 
-    while True:
-        now = time.time()
-        if now - t0 >= TOTAL_SECONDS:
-            break
-        if now >= next_t:
-            pkt = client.read_single(timeout=1.0)  
-            if pkt:
-                rows.append({
-                    "t_elapsed_s": round(now - t0, 2),
-                    "rpm": RPM,
-                    "torque_percent": pkt.get("torque_percent"),
-                    "torque_valid": pkt.get("torque_valid"),
-                    "temperature_c": pkt.get("temperature_c"),
-                    "temp_valid": pkt.get("temp_valid"),
-                    "viscosity_cp": pkt.get("viscosity_cp"),
-                    "status": pkt.get("status"),
-                    "record": pkt.get("record_number"),
-                })
-            next_t += SAMPLE_EVERY_SEC
-        else:
-            time.sleep(0.05)
+            while True:
+                now = clock.now()
+                if now - t0 >= TOTAL_SECONDS:
+                    break
+                if now >= next_t:
+                    pkt = client.read_single(timeout=1.0)  
+                    if pkt:
+                        w.writerow({
+                            "t_elapsed_s": round(now - t0, 2),
+                            "rpm": RPM,
+                            "torque_percent": pkt.get("torque_percent"),
+                            "torque_valid": pkt.get("torque_valid"),
+                            "temperature_c": pkt.get("temperature_c"),
+                            "temp_valid": pkt.get("temp_valid"),
+                            "viscosity_cp": pkt.get("viscosity_cp"),
+                            "status": pkt.get("status"),
+                            "record": pkt.get("record_number"),
+                        })
+                        if qc:
+                            qc.check(pkt, RPM)
+                    next_t += SAMPLE_EVERY_SEC
+                else:
+                    clock.sleep(0.05, "measure")
 
-    client.stop()
-    with out.open("w", newline="", encoding="utf-8") as f: # Write CSV
-        w = csv.DictWriter(f, fieldnames=[
-            "t_elapsed_s","rpm","torque_percent","torque_valid",
-            "temperature_c","temp_valid","viscosity_cp","status","record"
-        ])
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
+            client.stop()
+    except BaseException:  # QC trip or device error: this attempt leaves no file behind
+        partial.unlink(missing_ok=True)
+        raise
+    partial.replace(out)
     return str(out)
 
 # DYNAMIC ANALYSIS: pass an array of 10 RPMs; dwell at each; read one data point at end; pause between; CSV
-def run_dynamic_analysis(results_dir: pathlib.Path, client: ViscometerClient):
-    RPMS              = [2.5, 3.0, 3.5, 4.0, 4.5, 4.5, 4.5, 5.0, 5.5, 6.0]  
+def run_dynamic_analysis(results_dir: pathlib.Path, client: ViscometerClient, qc: Optional[QCMonitor] = None,
+                         rpm_scale: float = 1.0):
+    RPMS              = [r * rpm_scale for r in [2.5, 3.0, 3.5, 4.0, 4.5, 4.5, 4.5, 5.0, 5.5, 6.0]]
     DWELL_SECONDS     = 90.0     
     SETTLE_SECONDS    = 1.0     
     INTER_PAUSE_SEC   = 1.0      
@@ -63,13 +88,17 @@ def run_dynamic_analysis(results_dir: pathlib.Path, client: ViscometerClient):
     out = results_dir / CSV_NAME
     out.parent.mkdir(parents=True, exist_ok=True)
 
+    if qc:
+        qc.begin(len(RPMS) * (DWELL_SECONDS + INTER_PAUSE_SEC))
     rows = []
     for rpm in RPMS:
         client.set_speed(float(rpm))
-        time.sleep(SETTLE_SECONDS)
+        clock.sleep(SETTLE_SECONDS, "measure")
         # dwell at rpm
-        time.sleep(max(DWELL_SECONDS - SETTLE_SECONDS, 0.0))
+        _dwell(client, max(DWELL_SECONDS - SETTLE_SECONDS, 0.0), rpm, qc)
         pkt = client.read_single(timeout=1.0)
+        if qc:
+            qc.check(pkt, rpm)
         rows.append({
             "rpm": float(rpm),
             "torque_percent": None if not pkt else pkt.get("torque_percent"),
@@ -81,7 +110,7 @@ def run_dynamic_analysis(results_dir: pathlib.Path, client: ViscometerClient):
             "record":        None if not pkt else pkt.get("record_number"),
         })
         client.stop()
-        time.sleep(INTER_PAUSE_SEC)
+        clock.sleep(INTER_PAUSE_SEC, "measure")
 
     with out.open("w", newline="", encoding="utf-8") as f:   # Write CSV 
         w = csv.DictWriter(f, fieldnames=[
@@ -93,12 +122,111 @@ def run_dynamic_analysis(results_dir: pathlib.Path, client: ViscometerClient):
             w.writerow(r)
     return str(out)
 
+def _mean(pkts: List[dict], key: str):
+    vals = [p[key] for p in pkts if p.get(key) is not None]
+    return sum(vals) / len(vals) if vals else None
+
+def _trapz(xs: List[float], ys: List[float]) -> float:
+    return sum((xs[i + 1] - xs[i]) * (ys[i + 1] + ys[i]) / 2.0 for i in range(len(xs) - 1))
+
+# RAMP SWEEP: step the speed up then back down without stopping, sampling continuously; write flow curve
+# (mean of the settled part of each step) with the up/down hysteresis loop area, plus the raw time series
+def run_ramp_sweep(results_dir: pathlib.Path, client: ViscometerClient, qc: Optional[QCMonitor] = None,
+                   rpm_scale: float = 1.0):
+    START_RPM          = 2.5 * rpm_scale
+    END_RPM            = 6.0 * rpm_scale
+    STEP_RPM           = 0.5 * rpm_scale
+    STEP_SECONDS       = 10.0
+    SAMPLE_EVERY_SEC   = 1
+    AVG_LAST_FRAC      = 0.5     # average only the last half of each step (after the speed change settles)
+    CSV_NAME           = "ramp_sweep.csv"
+    RAW_CSV_NAME       = "ramp_sweep_raw.csv"
+
+    out = results_dir / CSV_NAME
+    out.parent.mkdir(parents=True, exist_ok=True)
+    n_up = int(round((END_RPM - START_RPM) / STEP_RPM)) + 1
+    up = [round(START_RPM + k * STEP_RPM, 3) for k in range(n_up)]
+    steps = [("up", r) for r in up] + [("down", r) for r in reversed(up[:-1])]
+
+    if qc:
+        qc.begin(len(steps) * STEP_SECONDS)
+    flow = []
+    t0 = clock.now()
+    with (results_dir / RAW_CSV_NAME).open("w", newline="", encoding="utf-8") as raw_f:
+        raw = csv.DictWriter(raw_f, fieldnames=[
+            "t_elapsed_s","phase","rpm","torque_percent","torque_valid",
+            "temperature_c","temp_valid","viscosity_cp","status","record"
+        ])
+        raw.writeheader()
+        for phase, rpm in steps:
+            client.set_speed(float(rpm))  # no stop in between: the spindle keeps its momentum
+            t_step = clock.now()
+            next_t = t_step + SAMPLE_EVERY_SEC
+            settled = []
+            while clock.now() - t_step < STEP_SECONDS:
+                now = clock.now()
+                if now < next_t:
+                    clock.sleep(0.05, "measure")
+                    continue
+                next_t += SAMPLE_EVERY_SEC
+                pkt = client.read_single(timeout=1.0)
+                if not pkt:
+                    continue
+                if qc:
+                    qc.check(pkt, rpm)
+                raw.writerow({
+                    "t_elapsed_s": round(now - t0, 2),
+                    "phase": phase,
+                    "rpm": rpm,
+                    "torque_percent": pkt.get("torque_percent"),
+                    "torque_valid": pkt.get("torque_valid"),
+                    "temperature_c": pkt.get("temperature_c"),
+                    "temp_valid": pkt.get("temp_valid"),
+                    "viscosity_cp": pkt.get("viscosity_cp"),
+                    "status": pkt.get("status"),
+                    "record": pkt.get("record_number"),
+                })
+                if now - t_step >= STEP_SECONDS * (1.0 - AVG_LAST_FRAC) and pkt.get("torque_valid"):
+                    settled.append(pkt)
+            flow.append({
+                "phase": phase,
+                "rpm": rpm,
+                "torque_percent": _mean(settled, "torque_percent"),
+                "torque_valid": bool(settled),
+                "temperature_c": _mean(settled, "temperature_c"),
+                "viscosity_cp": _mean(settled, "viscosity_cp"),
+                "n_points": len(settled),
+            })
+    client.stop()
+
+    # Hysteresis: area between up and down torque curves over rpm (torque % x rpm); > 0 means thixotropic
+    up_rows = [r for r in flow if r["phase"] == "up"]
+    down_rows = sorted([up_rows[-1]] + [r for r in flow if r["phase"] == "down"], key=lambda r: r["rpm"])
+    loop_area, up_area = None, None
+    if all(r["torque_percent"] is not None for r in up_rows + down_rows):
+        xs = [r["rpm"] for r in up_rows]
+        up_area = _trapz(xs, [r["torque_percent"] for r in up_rows])
+        loop_area = up_area - _trapz(xs, [r["torque_percent"] for r in down_rows])
+
+    with out.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["# Loop area (torque % x rpm)", None if loop_area is None else round(loop_area, 4)])
+        w.writerow(["# Loop area (% of up-curve area)",
+                    None if not up_area else round(100.0 * loop_area / up_area, 3)])
+        w.writerow(["# Sweep duration (s)", round(clock.now() - t0, 1)])
+        w.writerow(["phase","rpm","torque_percent","torque_valid","temperature_c","viscosity_cp","n_points"])
+        for r in flow:
+            w.writerow([r["phase"], r["rpm"], r["torque_percent"], r["torque_valid"],
+                        r["temperature_c"], r["viscosity_cp"], r["n_points"]])
+    return str(out)
+
 # BISECTION: find rpm that hits a target torque, then final hold; write CSV of search history + final point
-def run_bisection(results_dir: pathlib.Path, client: ViscometerClient):
+def run_bisection(results_dir: pathlib.Path, client: ViscometerClient, qc: Optional[QCMonitor] = None,
+                  rpm_scale: float = 1.0):
     TARGET_TORQUE_PCT = 50.0    
     TOL_PCT           = 20.0    
-    LOW_RPM           = 0.5
-    HIGH_RPM          = 30
+    LOW_RPM           = 0.5 * rpm_scale
+    HIGH_RPM          = 30 * rpm_scale
     MAX_ITERS         = 20
     SETTLE_SECONDS    = 60.0
     FINAL_HOLD_S      = 60.0     
@@ -108,6 +236,10 @@ def run_bisection(results_dir: pathlib.Path, client: ViscometerClient):
     out = results_dir / CSV_NAME
     out.parent.mkdir(parents=True, exist_ok=True)
 
+    # The search probes over-range speeds on purpose, so only immersion/temperature rules apply
+    QC_IGNORE         = ("over_range",)
+    if qc:
+        qc.begin(MAX_ITERS * (SETTLE_SECONDS + INTER_PAUSE_SEC) + FINAL_HOLD_S)  # upper bound
     history = []
     lo, hi = float(LOW_RPM), float(HIGH_RPM)
     best_rpm, best_err = None, float("inf")
@@ -115,10 +247,10 @@ def run_bisection(results_dir: pathlib.Path, client: ViscometerClient):
     for _ in range(MAX_ITERS):
         mid = (lo + hi) / 2.0
         client.set_speed(mid)
-        time.sleep(SETTLE_SECONDS)
+        _dwell(client, SETTLE_SECONDS, mid, qc, ignore=QC_IGNORE)
         pkt = client.read_single(timeout=1.0)
         client.stop()
-        time.sleep(INTER_PAUSE_SEC)
+        clock.sleep(INTER_PAUSE_SEC, "measure")
 
         if not pkt or not pkt.get("torque_valid"):
             # treat as unusable datapoint; shrink range slightly around mid and continue
@@ -142,7 +274,7 @@ def run_bisection(results_dir: pathlib.Path, client: ViscometerClient):
     # Final hold at best_rpm (if none, fall back to mid of last range)
     final_rpm = best_rpm if best_rpm is not None else (lo + hi) / 2.0
     client.set_speed(final_rpm)
-    time.sleep(FINAL_HOLD_S)
+    _dwell(client, FINAL_HOLD_S, final_rpm, qc, ignore=QC_IGNORE)
     final_pkt = client.read_single(timeout=1.0)
     client.stop()
 
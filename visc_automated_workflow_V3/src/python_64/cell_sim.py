@@ -0,0 +1,318 @@
+# Discrete-event simulation of the whole cell: main.main() runs unchanged on a virtual clock with
+# simulated CNC, pump and viscometer, to plan throughput and find bottlenecks without hardware
+import argparse, bisect, contextlib, io, json, math, pathlib, random, sys, tempfile, threading
+from typing import Any, Dict, List, Optional, Tuple
+import clock
+import main as workflow
+from cnc_controller import CNC_Machine
+from move_to_locations import PumpESP32, ESP32_BOOT_DELAY_S
+from measurement_qc import QC_LOG_NAME
+from run_journal import RunJournal
+
+# Device models (seconds unless noted)
+CNC_SESSION_S    = 1.35     # per follow_gcode_path: serial open, 1 s GRBL wake, first idle poll
+CNC_MOVE_S       = 0.15     # accel/decel overhead per G-code line
+WORKER_SPAWN_S   = 1.5      # 32-bit interpreter start + imports
+VISCO_INIT_S     = 2.0      # DLL load + serial open
+VISCO_REQUEST_S  = 0.12     # one worker request: pipe round trip + serial exchange
+SIM_FLUIDS_CP    = (50.0, 800.0, 2500.0)  # sample viscosities, cycled over the rack
+SOLVENT_CP       = 1.0      # wash solvent
+RESIDUE_FRAC     = 0.05     # fraction of the sample viscosity left on the spindle, seen in the rinse
+WASH_CARRYOVER   = 0.1      # residue left after each wash stage
+TORQUE_NOISE_PCT = 0.05
+SIM_SEED         = 1
+
+# Activity label passed to clock.sleep() -> resource it occupies; unlabelled waits count as other/wait
+RESOURCES = {"measure": "viscometer", "wash check": "viscometer", "wash": "wash", "settle": "cnc"}
+
+class VirtualClock:
+    # Each thread has its own virtual time; sleeping advances it and records a labelled event.
+    # Bring-up tasks fork/join through resume_at/advance_to (see startup.Bringup).
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.events: List[List[Any]] = []  # [thread, resource, activity, start, end]
+        self._last: Dict[str, List[Any]] = {}
+
+    def now(self) -> float:
+        return getattr(self._local, "t", 0.0)
+
+    def resume_at(self, t: float):
+        self._local.t = t
+
+    def advance_to(self, t: float):
+        if t > self.now():
+            self._local.t = t
+
+    def sleep(self, seconds: float, activity: Optional[str] = None):
+        if activity is None:
+            self.busy("other", "wait", seconds)
+        else:
+            self.busy(RESOURCES[activity], activity, seconds)
+
+    def busy(self, resource: str, activity: str, seconds: float):
+        if seconds <= 0:
+            return
+        start = self.now()
+        end = self._local.t = start + seconds
+        name = threading.current_thread().name
+        with self._lock:
+            last = self._last.get(name)
+            # merge back-to-back waits of the same kind (polling loops) into one event
+            if last and last[1] == resource and last[2] == activity and abs(last[4] - start) < 1e-9:
+                last[4] = end
+                return
+            ev = [name, resource, activity, start, end]
+            self.events.append(ev)
+            self._last[name] = ev
+
+class Cell:
+    # Shared physical state the simulated devices read: where the spindle is and what is on it
+    def __init__(self, vclock: VirtualClock, fluids=SIM_FLUIDS_CP, seed: int = SIM_SEED):
+        self.clock = vclock
+        self.fluids = tuple(fluids)
+        self.location: Tuple[str, int] = ("home", 0)
+        self.residue_cp = 0.0
+        self.rng = random.Random(seed)
+
+    def viscosity_here(self) -> float:
+        name, idx = self.location
+        if name == "washing_station":
+            return SOLVENT_CP + self.residue_cp
+        if name == "home":
+            return 0.0
+        return self.fluids[idx % len(self.fluids)]
+
+    def arrive(self, name: str, idx: int):
+        self.location = (name, idx)
+        if name not in ("washing_station", "home"):
+            self.residue_cp = self.viscosity_here() * RESIDUE_FRAC
+
+class SimCNC(CNC_Machine):
+    LOCATION_FILE = str(pathlib.Path(__file__).resolve().parents[2] / "config" / "locations.yaml")
+
+    def __init__(self, cell: Cell):
+        self.cell = cell
+        self.pos = [0.0, 0.0, 0.0]
+        super().__init__(virtual=True)
+
+    def move_to_location(self, name: str, idx: int, safe: bool = True, speed: int = 3000):
+        super().move_to_location(name, idx, safe=safe, speed=speed)
+        self.cell.arrive(name, idx)
+
+    def follow_gcode_path(self, gcode: str, buffer: int = 20):
+        # Travel time from the G-code itself: straight-line distance at the commanded feed
+        t = CNC_SESSION_S
+        feed = 3000.0
+        for line in gcode.splitlines():
+            target = list(self.pos)
+            for word in line.split()[1:]:
+                axis, val = word[0], float(word[1:])
+                if axis == "F":
+                    feed = val
+                elif axis in "XYZ":
+                    target["XYZ".index(axis)] = val
+            t += math.dist(self.pos, target) / (feed / 60.0) + CNC_MOVE_S
+            self.pos = target
+        self.cell.clock.busy("cnc", "travel", t)
+        return ["ok"]
+
+class SimPump(PumpESP32):
+    def __init__(self, cell: Cell):
+        super().__init__(port="SIM", virtual=True)
+        self.cell = cell
+
+    def open(self):
+        self.cell.clock.busy("pump", "boot", ESP32_BOOT_DELAY_S)
+
+    def send_tag(self, tag: bytes):
+        self.cell.residue_cp *= WASH_CARRYOVER
+
+class SimViscometer:
+    # Same surface as ViscometerClient / SupervisedViscometer; packets come from the fluid under the spindle
+    def __init__(self, cell: Cell):
+        self.cell = cell
+        self.listeners = []
+        self.rpm = 0.0
+        self.spindle_k = 992.47
+        self.record = 0
+        cell.clock.busy("viscometer", "spawn", WORKER_SPAWN_S)
+
+    def _request(self):
+        self.cell.clock.busy("viscometer", "request", VISCO_REQUEST_S)
+
+    def init(self, *, port: str, baud: int, timeout: float = 1.0, spindle_k: float = 992.47):
+        self.spindle_k = spindle_k
+        self.cell.clock.busy("viscometer", "init", VISCO_INIT_S)
+        return {"ok": True}
+
+    def status(self, timeout_s: float = 5):
+        self._request()
+        return {"ok": True}
+
+    def identify(self):
+        self._request()
+        return {"series": "SIM", "model": "00", "fw_version": "00.00.00", "status": 0}
+
+    def zero(self):
+        self._request()
+        return {"status": 0}
+
+    def set_speed(self, rpm: float):
+        self._request()
+        self.rpm = float(rpm)
+        return {"rpm": self.rpm}
+
+    def stop(self):
+        self._request()
+        self.rpm = 0.0
+        return {}
+
+    def read_single(self, timeout: float = 1.0):
+        self._request()
+        self.record += 1
+        tq = self.cell.viscosity_here() * self.rpm / self.spindle_k + self.cell.rng.gauss(0.0, TORQUE_NOISE_PCT)
+        tq = max(tq, 0.0)
+        valid = tq <= 100.0
+        pkt = {
+            "record_number": self.record & 0xFFFF,
+            "torque_raw": min(round(tq * 100), 0xFFFC), "temp_raw": 12500, "status": 0, "status_binary": "00000000",
+            "torque_percent": tq, "torque_valid": valid, "torque_percent_capped": min(tq, 100.0),
+            "temperature_c": 25.0, "temp_valid": True,
+            "viscosity_cp": tq * self.spindle_k / self.rpm if valid and self.rpm > 0 else None,
+        }
+        for fn in self.listeners:
+            try:
+                fn(pkt, self.rpm)
+            except Exception:
+                pass
+        return pkt
+
+    def close(self):
+        pass
+
+@contextlib.contextmanager
+def _settings(**overrides):
+    # Temporarily override main.py configuration constants
+    saved = {k: getattr(workflow, k) for k in overrides}
+    for k, v in overrides.items():
+        setattr(workflow, k, v)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(workflow, k, v)
+
+def utilisation(events, makespan: float) -> Dict[str, float]:
+    # Busy fraction of each resource (union of its intervals over all threads)
+    out = {}
+    for res in sorted({e[1] for e in events}):
+        busy, cur_s, cur_e = 0.0, None, None
+        for _, _, _, s, e in sorted((ev for ev in events if ev[1] == res), key=lambda ev: ev[3]):
+            if cur_e is None or s > cur_e:
+                if cur_e is not None:
+                    busy += cur_e - cur_s
+                cur_s, cur_e = s, e
+            else:
+                cur_e = max(cur_e, e)
+        if cur_e is not None:
+            busy += cur_e - cur_s
+        out[res] = round(busy / makespan, 4) if makespan else 0.0
+    return out
+
+def critical_path(events, makespan: float, eps: float = 1e-6) -> List[Tuple[str, str, float, float]]:
+    # Walk back from the makespan: each step takes the event that ended last before the current point
+    # (preferring the same thread), gaps nobody was busy in are reported as idle
+    evs = sorted(events, key=lambda e: e[4])
+    ends = [e[4] for e in evs]
+    path, cursor, thread = [], makespan, None
+    while cursor > eps:
+        i = bisect.bisect_right(ends, cursor + eps) - 1
+        if i < 0:
+            path.append(("idle", "idle", 0.0, cursor))
+            break
+        j, best = i, None
+        while j >= 0 and ends[j] >= ends[i] - eps:
+            e = evs[j]
+            if e[3] < cursor - eps and (best is None or (e[0] == thread) > (best[0] == thread)
+                                        or ((e[0] == thread) == (best[0] == thread) and e[4] - e[3] > best[4] - best[3])):
+                best = e
+            j -= 1
+        if best is None:
+            break
+        if best[4] < cursor - eps:
+            path.append(("idle", "idle", best[4], cursor))
+        path.append((best[1], best[2], best[3], min(best[4], cursor)))
+        cursor, thread = best[3], best[0]
+    path.reverse()
+    return path
+
+def simulate(samples: int = 3, mode: str = "single", wash: bool = True, adaptive: bool = True, qc: bool = True,
+             fluids=SIM_FLUIDS_CP, quiet: bool = True) -> Dict[str, Any]:
+    vclock = VirtualClock()
+    cell = Cell(vclock, fluids)
+    devices = {"cnc": lambda: SimCNC(cell), "pump": lambda: SimPump(cell), "worker": lambda: SimViscometer(cell)}
+    prev = clock.set_clock(vclock)
+    out = io.StringIO() if quiet else sys.stdout
+    try:
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(out), \
+                _settings(SAMPLE_RANGE=range(samples), ANALYSIS_MODE=mode, ENABLE_WASH=wash,
+                          ADAPTIVE_WASH=adaptive, WASH_BASELINE_PCT=None, ENABLE_QC=qc,
+                          ENABLE_LIVE_FEED=False, SHEAR_RATE_K=None):
+            results_root = pathlib.Path(tmp)
+            workflow.main(results_root=results_root, devices=devices)
+            journal = RunJournal(results_root).entries()
+            qc_rows = (results_root / QC_LOG_NAME).read_text().splitlines()[1:] \
+                if (results_root / QC_LOG_NAME).exists() else []
+    finally:
+        clock.set_clock(prev)
+
+    events = vclock.events
+    makespan = max(e[4] for e in events)
+    # Steady-state cycle time: spacing of successive sample arrivals in the journal (virtual timestamps)
+    moved = [e["ts"] for e in journal if e.get("state") == "moved"]
+    gaps = [b - a for a, b in zip(moved, moved[1:])]
+    path = critical_path(events, makespan)
+    on_path: Dict[str, float] = {}
+    for res, act, s, e in path:
+        key = f"{res}/{act}"
+        on_path[key] = on_path.get(key, 0.0) + (e - s)
+    return {
+        "samples": samples,
+        "mode": mode,
+        "makespan_s": round(makespan, 1),
+        "throughput_per_h": round(samples * 3600.0 / makespan, 2),
+        "first_sample_at_s": round(moved[0], 1) if moved else None,
+        "cycle_s": round(sum(gaps) / len(gaps), 1) if gaps else None,
+        "utilisation": utilisation(events, makespan),
+        "critical_path": {k: round(v, 1) for k, v in sorted(on_path.items(), key=lambda kv: -kv[1])},
+        "qc_trips": [r for r in qc_rows if ",pass," not in r],
+    }
+
+def print_report(r: Dict[str, Any]):
+    print(f"[SIM] {r['samples']} samples ({r['mode']}): makespan {r['makespan_s']:.0f}s, "
+          f"{r['throughput_per_h']:.2f} samples/h, first sample at {r['first_sample_at_s']}s, cycle {r['cycle_s']}s")
+    print("[SIM] utilisation: " + ", ".join(f"{k} {v:.0%}" for k, v in r["utilisation"].items()))
+    print("[SIM] critical path:")
+    for k, v in r["critical_path"].items():
+        print(f"  {k:<22} {v:8.1f}s  {v / r['makespan_s']:6.1%}")
+    for row in r["qc_trips"]:
+        print(f"[SIM] QC: {row}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Simulate a run of the cell in virtual time")
+    ap.add_argument("--samples", type=int, default=3)
+    ap.add_argument("--mode", default="single", choices=("single", "dynamic", "ramp", "bisection"))
+    ap.add_argument("--no-wash", action="store_true")
+    ap.add_argument("--fixed-wash", action="store_true", help="always run all three wash stages")
+    ap.add_argument("--no-qc", action="store_true")
+    ap.add_argument("--fluids", default=",".join(f"{v:g}" for v in SIM_FLUIDS_CP),
+                    help="comma-separated sample viscosities in cP, cycled over the rack")
+    ap.add_argument("--json", help="also write the report to this file")
+    ap.add_argument("--verbose", action="store_true", help="show the workflow's own output")
+    a = ap.parse_args()
+    report = simulate(a.samples, a.mode, wash=not a.no_wash, adaptive=not a.fixed_wash, qc=not a.no_qc,
+                      fluids=[float(v) for v in a.fluids.split(",")], quiet=not a.verbose)
+    print_report(report)
+    if a.json:
+        pathlib.Path(a.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
@@ -0,0 +1,45 @@
+# Injectable clock: every workflow wait/timestamp goes through here so a run can be replayed in virtual time
+import time as _time
+from typing import Optional
+
+class RealClock:
+    def now(self) -> float:
+        return _time.time()
+
+    def sleep(self, seconds: float, activity: Optional[str] = None):
+        # activity labels the wait for a simulation's timeline; wall time ignores it
+        if seconds > 0:
+            _time.sleep(seconds)
+
+    # Fork/join hooks for concurrent tasks (see startup.Bringup); wall time needs neither
+    def resume_at(self, t: float):
+        pass
+
+    def advance_to(self, t: float):
+        pass
+
+_clock = RealClock()
+
+def set_clock(c) -> object:
+    # Install a clock (e.g. cell_sim.VirtualClock); returns the previous one so callers can restore it
+    global _clock
+    prev, _clock = _clock, c
+    return prev
+
+def get_clock():
+    return _clock
+
+def now() -> float:
+    return _clock.now()
+
+def sleep(seconds: float, activity: Optional[str] = None):
+    # activity: what the wait is for ("measure", "wash", "wash check", "settle"), see cell_sim.RESOURCES
+    _clock.sleep(seconds, activity)
+
+def resume_at(t: float):
+    # Continue the calling thread's timeline at t (a task starting after its dependencies)
+    _clock.resume_at(t)
+
+def advance_to(t: float):
+    # Make sure the calling thread's time is at least t (joining a task that ended at t)
+    _clock.advance_to(t)
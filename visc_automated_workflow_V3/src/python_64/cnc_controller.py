@@ -1,4 +1,5 @@
-import serial, time, math, yaml
+import serial, math, yaml
+import clock
 
 class CNC_Machine:
     BAUD_RATE = 115200
@@ -18,18 +19,18 @@ class CNC_Machine:
     # serial helpers
     def _wake(self, ser):
         ser.write(str.encode("\r\n\r\n"))
-        time.sleep(1)
+        clock.sleep(1)
         ser.reset_input_buffer()
 
     def _wait_idle(self, ser):
-        time.sleep(0.25)
+        clock.sleep(0.25)
         while True:
             ser.reset_input_buffer()
             ser.write(b"?\n")
             line = ser.readline().decode(errors="ignore").strip()
             if "Idle" in line:
                 break
-            time.sleep(0.1)
+            clock.sleep(0.1)
 
     # motion builders
     def _within(self, x, y, z) -> bool:
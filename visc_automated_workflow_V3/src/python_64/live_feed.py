@@ -0,0 +1,307 @@
+# Live data feed for the dashboard: Server-Sent Events over a local asyncio HTTP server
+import asyncio, csv, json, math, pathlib, threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import clock
+from raw_archive import RawArchive, ARCHIVE_DIR, run_archives, to_physical
+
+LIVE_HOST        = "127.0.0.1"
+LIVE_PORT        = 8765
+CLIENT_QUEUE_MAX = 256     # per-client backlog; older points are coalesced away beyond this
+DRAIN_TIMEOUT_S  = 2.0     # a client that cannot take a write within this is dropped
+RECENT_MAX       = 20000   # points kept in memory for late joiners (/recent)
+DEFAULT_POINTS   = 500
+FIELDS           = ("torque_percent", "viscosity_cp", "temperature_c")
+
+# Downsampling (both return sorted indices into xs/ys)
+def lttb(xs: List[float], ys: List[float], n: int) -> List[int]:
+    # Largest-Triangle-Three-Buckets: keeps visual shape with n points
+    size = len(xs)
+    if n >= size or n < 3:
+        return list(range(size))
+    every = (size - 2) / (n - 2)
+    out, a = [0], 0
+    for i in range(n - 2):
+        lo = int(math.floor((i + 1) * every)) + 1
+        hi = min(int(math.floor((i + 2) * every)) + 1, size)
+        avg_x = sum(xs[lo:hi]) / (hi - lo)
+        avg_y = sum(ys[lo:hi]) / (hi - lo)
+        ax, ay = xs[a], ys[a]
+        best, best_area = lo - 1, -1.0
+        for j in range(int(math.floor(i * every)) + 1, lo):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(size - 1)
+    return out
+
+def minmax(xs: List[float], ys: List[float], n: int) -> List[int]:
+    # Keep the min and max of each bucket; cheaper than LTTB, preserves spikes
+    size = len(xs)
+    if n >= size or n < 2:
+        return list(range(size))
+    buckets = max(n // 2, 1)
+    out = set()
+    for b in range(buckets):
+        lo, hi = b * size // buckets, (b + 1) * size // buckets
+        if hi <= lo:
+            continue
+        seg = range(lo, hi)
+        out.add(min(seg, key=ys.__getitem__))
+        out.add(max(seg, key=ys.__getitem__))
+    return sorted(out)
+
+DOWNSAMPLERS = {"lttb": lttb, "minmax": minmax}
+
+def downsample(points: List[Dict[str, Any]], x: str, y: str, n: int, method: str = "lttb"):
+    pts = [p for p in points if p.get(x) not in (None, "") and p.get(y) not in (None, "")]
+    xs = [float(p[x]) for p in pts]
+    ys = [float(p[y]) for p in pts]
+    return [pts[i] for i in DOWNSAMPLERS[method](xs, ys, n)]
+
+class LiveFeed:
+    def __init__(self, results_root: pathlib.Path, host: str = LIVE_HOST, port: int = LIVE_PORT):
+        self.results_root = pathlib.Path(results_root)
+        self.host = host
+        self.port = port
+        self.sample: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._clients: Dict[asyncio.Queue, Dict[str, int]] = {}
+        self._tasks: set = set()  # connection handlers, cancelled on stop()
+        self._recent: deque = deque(maxlen=RECENT_MAX)
+        self.archive: Optional[RawArchive] = None  # raw packet archive of the current run, for /archive
+
+    # Lifecycle (server runs on its own event loop thread)
+    def start(self):
+        # Raises OSError (e.g. port already in use) if the server cannot be bound
+        ready = threading.Event()
+        failure: List[BaseException] = []
+
+        def _run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                self._server = loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port))
+            except BaseException as e:
+                failure.append(e)
+                loop.close()
+                ready.set()
+                return
+            self._loop = loop  # only published once bound, so publish() never queues onto a dead loop
+            ready.set()
+            loop.run_forever()
+            loop.close()
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout=5):
+            raise TimeoutError(f"live feed did not start on {self.host}:{self.port}")
+        if failure:
+            raise failure[0]
+        print(f"[LIVE] dashboard feed on http://{self.host}:{self.port}/live")
+
+    def stop(self):
+        loop = self._loop
+        if loop is None:
+            return
+        self._loop = None
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop)  # stops the loop once everything is closed
+        self._thread.join(timeout=2 * DRAIN_TIMEOUT_S)
+        self._server = None
+
+    async def _shutdown(self):
+        # Runs on the loop: no new connections, open ones (e.g. /live streams) cancelled and finished
+        try:
+            if self._server is not None:
+                self._server.close()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            if self._server is not None:
+                await self._server.wait_closed()
+        finally:
+            asyncio.get_running_loop().stop()
+
+    # Acquisition side: never blocks, only hands the point over to the loop thread
+    def set_sample(self, idx: Optional[int]):
+        self.sample = idx
+
+    def publish(self, pkt: Dict[str, Any], rpm: Optional[float] = None):
+        loop = self._loop
+        if loop is None or not pkt:
+            return
+        point = {
+            "t": round(clock.now(), 3),
+            "sample": self.sample,
+            "rpm": rpm,
+            "torque_percent": pkt.get("torque_percent"),
+            "viscosity_cp": pkt.get("viscosity_cp"),
+            "temperature_c": pkt.get("temperature_c"),
+            "status": pkt.get("status"),
+            "record": pkt.get("record_number"),
+        }
+        loop.call_soon_threadsafe(self._broadcast, point)
+
+    def _broadcast(self, point: Dict[str, Any]):
+        self._recent.append(point)
+        for q, stats in self._clients.items():
+            if q.full():
+                q.get_nowait()  # coalesce: slow consumers lose the oldest points, never block us
+                stats["dropped"] += 1
+            q.put_nowait(point)
+
+    # HTTP
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            request = await asyncio.wait_for(reader.readline(), DRAIN_TIMEOUT_S)
+            while (await asyncio.wait_for(reader.readline(), DRAIN_TIMEOUT_S)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] != "GET":
+                return await self._send(writer, 405, {"error": "only GET is supported"})
+            url = urlsplit(parts[1])
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path == "/live":
+                field, method = self._check_query(query, "minmax")
+                return await self._stream(writer, query, field, method)
+            if url.path == "/recent":
+                return await self._send(writer, 200, self._recent_window(query))
+            if url.path == "/history":
+                loop = asyncio.get_running_loop()
+                return await self._send(writer, 200, await loop.run_in_executor(None, self._history, query))
+            if url.path == "/archive":
+                loop = asyncio.get_running_loop()
+                return await self._send(writer, 200, await loop.run_in_executor(None, self._archive_window, query))
+            if url.path == "/index":
+                loop = asyncio.get_running_loop()
+                return await self._send(writer, 200, await loop.run_in_executor(None, self._index))
+            await self._send(writer, 404, {"error": f"unknown path {url.path}"})
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            await self._send(writer, 400, {"error": str(e)})
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass  # stop(): end the connection normally (a handler task ending cancelled gets logged by asyncio)
+        finally:
+            writer.close()
+            self._tasks.discard(task)
+
+    async def _send(self, writer: asyncio.StreamWriter, code: int, obj: Any):
+        body = json.dumps(obj).encode()
+        head = (f"HTTP/1.1 {code} {'OK' if code == 200 else 'Error'}\r\n"
+                "Content-Type: application/json\r\n"
+                "Access-Control-Allow-Origin: *\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n")
+        writer.write(head.encode() + body)
+        await asyncio.wait_for(writer.drain(), DRAIN_TIMEOUT_S)
+
+    async def _stream(self, writer: asyncio.StreamWriter, query: Dict[str, str], field: str, method: str):
+        # One SSE event per batch; everything queued since the last write is coalesced into it
+        max_points = int(query.get("points", DEFAULT_POINTS))
+        q: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_MAX)
+        stats = {"dropped": 0}
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Access-Control-Allow-Origin: *\r\n\r\n")
+        self._clients[q] = stats
+        try:
+            while True:
+                batch = [await q.get()]
+                while not q.empty():
+                    batch.append(q.get_nowait())
+                if len(batch) > max_points:
+                    # points without the field (rpm 0, invalid torque) still carry readings: keep them
+                    kept = downsample(batch, "t", field, max_points, method)
+                    batch = sorted(kept + [p for p in batch if p.get(field) is None], key=lambda p: p["t"])
+                payload = {"points": batch, "dropped": stats["dropped"]}
+                writer.write(f"data: {json.dumps(payload)}\n\n".encode())
+                await asyncio.wait_for(writer.drain(), DRAIN_TIMEOUT_S)
+        finally:
+            del self._clients[q]
+
+    # Queries
+    @staticmethod
+    def _check_query(query: Dict[str, str], default_method: str):
+        field = query.get("field", "viscosity_cp")
+        method = query.get("method", default_method)
+        if field not in FIELDS:
+            raise ValueError(f"field must be one of {FIELDS}")
+        if method not in DOWNSAMPLERS:
+            raise ValueError(f"method must be one of {tuple(DOWNSAMPLERS)}")
+        return field, method
+
+    def _recent_window(self, query: Dict[str, str]) -> Dict[str, Any]:
+        field, method = self._check_query(query, "lttb")
+        t0 = float(query.get("t0", "-inf"))
+        t1 = float(query.get("t1", "inf"))
+        pts = [p for p in self._recent if t0 <= p["t"] <= t1]
+        n = int(query.get("points", DEFAULT_POINTS))
+        return {"points": downsample(pts, "t", field, n, method)}
+
+    def _history(self, query: Dict[str, str]) -> Dict[str, Any]:
+        # Window of a finished results CSV, e.g. /history?sample=0&file=single_rpm_32.00.csv&x0=0&x1=60
+        name = query["file"]
+        if pathlib.Path(name).name != name or not name.endswith(".csv"):
+            raise ValueError("file must be a CSV name inside the sample folder")
+        path = self.results_root / f"sample_{int(query['sample']):03d}" / name
+        x = query.get("x", "t_elapsed_s")
+        y = query.get("y", "viscosity_cp")
+        x0 = float(query.get("x0", "-inf"))
+        x1 = float(query.get("x1", "inf"))
+        method = query.get("method", "lttb")
+        if method not in DOWNSAMPLERS:
+            raise ValueError(f"method must be one of {tuple(DOWNSAMPLERS)}")
+        with path.open(newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            missing = [c for c in (x, y) if c not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{name} has no column(s) {', '.join(missing)}")
+            rows = [r for r in reader if r.get(x) not in (None, "") and x0 <= float(r[x]) <= x1]
+        n = int(query.get("points", DEFAULT_POINTS))
+        pts = downsample(rows, x, y, n, method)
+        return {"file": str(path.relative_to(self.results_root)), "x": x, "y": y,
+                "total": len(rows), "points": [{x: float(p[x]), y: float(p[y])} for p in pts]}
+
+    def _archive_window(self, query: Dict[str, str]) -> Dict[str, Any]:
+        # Window of a raw packet archive, e.g. /archive?t0=...&t1=...&field=torque_percent&sample=0;
+        # run=run_<ts> (see /index) reads a past run, otherwise the current run's archive is used
+        field, method = self._check_query(query, "lttb")
+        run = query.get("run")
+        if run is not None:
+            if pathlib.Path(run).name != run or not run.startswith("run_"):
+                raise ValueError("run must be an archive folder name from /index")
+            archive = RawArchive(self.results_root / ARCHIVE_DIR / run, readonly=True)
+        elif self.archive is not None:
+            archive = self.archive
+        else:
+            raise ValueError("no raw archive for the current run")
+        cols = to_physical(archive.window(float(query.get("t0", "-inf")), float(query.get("t1", "inf"))),
+                           archive.index["meta"].get("spindle_k"))
+        if field not in cols:
+            raise ValueError(f"{field} needs spindle_k in the archive meta")
+        keep = np.isfinite(cols[field])
+        if "sample" in query:
+            keep &= cols["sample"] == int(query["sample"])
+        t, y, rpm, sample = (cols[k][keep] for k in ("t", field, "rpm", "sample"))
+        n = int(query.get("points", DEFAULT_POINTS))
+        idx = DOWNSAMPLERS[method](t.tolist(), y.tolist(), n)
+        return {"run": archive.path.name, "field": field, "total": int(keep.sum()),
+                "points": [{"t": float(t[i]), "sample": int(sample[i]), "rpm": float(rpm[i]), field: float(y[i])}
+                           for i in idx]}
+
+    def _index(self) -> Dict[str, List[str]]:
+        index = {d.name: sorted(p.name for p in d.glob("*.csv"))
+                 for d in sorted(self.results_root.glob("sample_*")) if d.is_dir()}
+        index[ARCHIVE_DIR] = [p.name for p in run_archives(self.results_root)]
+        return index
@@ -1,10 +1,18 @@
 # src/python_64/main.py
+import argparse
 import pathlib
-import time
+from collections import deque
 from cnc_controller import CNC_Machine
-from move_to_locations import PumpESP32, go_to_sample, wash1, wash2, wash3
-from viscometer_client import ViscometerClient
-from analysis_methods import run_single_rpm, run_dynamic_analysis, run_bisection
+from move_to_locations import PumpESP32, go_to_sample, wash1, wash2, wash3, adaptive_wash, calibrate_wash_baseline
+from viscometer_supervisor import SupervisedViscometer
+from analysis_methods import run_single_rpm, run_dynamic_analysis, run_bisection, run_ramp_sweep
+from live_feed import LiveFeed, LIVE_PORT
+from rheology_fit import fit_campaign
+from run_journal import RunJournal, fsync_file
+from measurement_qc import QCMonitor, QCTrip, log_qc
+from startup import Bringup
+from raw_archive import RawArchive, ARCHIVE_DIR
+import clock
 
 # Paths & device settings 
 PYTHON32    = ".\\.venv32\\Scripts\\python.exe"  
@@ -12,7 +20,9 @@ VISCO_PORT  = "COM6"
 VISCO_BAUD  = 115200
 VISCO_TOUT  = 1.0
 SPINDLE_K   = 992.47
-ANALYSIS_MODE = "single"  # "single" | "dynamic" | "bisection"
+SHEAR_RATE_K = None       # spindle shear rate per rpm (1/s per rpm); set to fit flow curves after a dynamic/ramp run
+FIT_PATTERNS = {"dynamic": "sample_*/dynamic_analysis.csv", "ramp": "sample_*/ramp_sweep.csv"}
+ANALYSIS_MODE = "single"  # "single" | "dynamic" | "ramp" | "bisection"
 SAMPLE_RACK  = "main_rack_A"
 SAMPLE_RANGE = range(0, 1)  
 
@@ -21,9 +31,21 @@ ENABLE_WASH  = False
 ESP32_PORT = "COM4"  
 ESP32_BAUD = 9600
 PUMP_VIRTUAL = True             
+ADAPTIVE_WASH = True            # residual-torque check decides how many wash stages run (see move_to_locations)
+WASH_BASELINE_PCT = None        # clean-solvent torque %; None calibrates it at startup
 PAUSE_AFTER_HOME = 0.2
 PAUSE_AFTER_MOVE = 0.1
 
+# Measurement QC (rules and actions in measurement_qc.QC_RULES)
+ENABLE_QC = True
+
+# Live dashboard feed (port set in live_feed.LIVE_PORT)
+ENABLE_LIVE_FEED = True
+
+# Raw packet archive: every packet of the run in results/raw_archive/run_<start time>/ (see raw_archive.py)
+ENABLE_RAW_ARCHIVE = True
+RAW_ARCHIVE_COMPRESS = False   # compress chunks as they are sealed (smaller, but reads decompress)
+
 def _root_dir() -> pathlib.Path:
     return pathlib.Path(__file__).resolve().parents[2]
 
@@ -35,61 +57,229 @@ def _results_dir() -> pathlib.Path:
     d.mkdir(parents=True, exist_ok=True)
     return d
 
-def main():
-    root = _root_dir()
-    results_root = _results_dir()
-    worker = _worker_path()
-    
-    cnc = CNC_Machine(virtual=False)
-    cnc.home()
-    time.sleep(PAUSE_AFTER_HOME)
+def _devices() -> dict:
+    # Device factories used by bring-up; cell_sim passes simulated ones with the same call surface
+    return {
+        "cnc": lambda: CNC_Machine(virtual=False),
+        "pump": lambda: PumpESP32(port=ESP32_PORT, baud=ESP32_BAUD, virtual=PUMP_VIRTUAL),
+        "worker": lambda: SupervisedViscometer(PYTHON32, _worker_path()),  # restarts the worker on hangs/crashes
+    }
 
-    pump = None
-    if ENABLE_WASH:
-        pump = PumpESP32(port=ESP32_PORT, baud=ESP32_BAUD, virtual=PUMP_VIRTUAL)
+def _run_analysis(sample_dir: pathlib.Path, client, qc=None, rpm_scale: float = 1.0) -> str:
+    if ANALYSIS_MODE == "single":
+        return run_single_rpm(sample_dir, client, qc, rpm_scale)
+    if ANALYSIS_MODE == "dynamic":
+        return run_dynamic_analysis(sample_dir, client, qc, rpm_scale)
+    if ANALYSIS_MODE == "ramp":
+        return run_ramp_sweep(sample_dir, client, qc, rpm_scale)
+    if ANALYSIS_MODE == "bisection":
+        return run_bisection(sample_dir, client, qc, rpm_scale)
+    raise ValueError(f"Unknown ANALYSIS_MODE: {ANALYSIS_MODE}")
+
+def _wash_sequence(cnc, pump):
+    wash1(cnc, pump)
+    wash2(cnc, pump)
+    wash3(cnc, pump)
+
+def _wash(cnc, pump, client, viscosity_cp, baseline_pct) -> dict:
+    if ADAPTIVE_WASH and baseline_pct is not None:
+        return adaptive_wash(cnc, pump, client, viscosity_cp, baseline_pct)
+    _wash_sequence(cnc, pump)
+    return {"stages": [1, 2, 3]}
+
+def main(resume: bool = False, results_root: pathlib.Path = None, devices: dict = None):
+    if results_root is None:
+        results_root = _results_dir()
+    results_root.mkdir(parents=True, exist_ok=True)
+    devices = {**_devices(), **(devices or {})}
+
+    # Journal: a fresh run records its sample list; --resume continues the latest one
+    journal = RunJournal(results_root)
+    finished = {"written", "qc_abort"}  # nothing left to measure, spindle may still need washing
+    done_states = {"washed"} if ENABLE_WASH else finished | {"washed"}
+    run = journal.run_config() if resume else None
+    if resume and run is None:
+        print("[RESUME] no journal found; starting a fresh run")
+    if run is None:
+        samples = list(SAMPLE_RANGE)
+        progress = {}
+        journal.record(None, "run_start", mode=ANALYSIS_MODE, rack=SAMPLE_RACK, samples=samples)
+    else:
+        samples = run["samples"]
+        progress = journal.progress()
+        journal.record(None, "resume")
+        if run.get("mode") != ANALYSIS_MODE or run.get("rack") != SAMPLE_RACK:
+            print(f"[RESUME WARN] journal run used mode={run.get('mode')} rack={run.get('rack')}; "
+                  f"current settings are mode={ANALYSIS_MODE} rack={SAMPLE_RACK}")
+        n_done = sum(1 for i in samples if progress.get(i) in done_states)
+        print(f"[RESUME] {n_done}/{len(samples)} samples already complete")
+
+    # Bring-up: CNC (YAML + homing), pump (serial + ESP32 boot) and the 32-bit worker start together;
+    # measuring waits on CNC + viscometer only, the pump is first waited on when it is needed
+    def _home(cnc):
+        if run is None:
+            cnc.home()  # on resume the first move is a safe (Z-up) move anyway
+            clock.sleep(PAUSE_AFTER_HOME, "settle")
+        return cnc
+
+    def _open_pump():
+        pump = devices["pump"]()
         pump.open()
+        return pump
 
-    client = ViscometerClient(PYTHON32, worker)
-    try:
+    def _init_visco(client):
         client.init(port=VISCO_PORT, baud=VISCO_BAUD, timeout=VISCO_TOUT, spindle_k=SPINDLE_K)
+        return client
 
-        for i in SAMPLE_RANGE:
+    bringup = Bringup()
+    bringup.add("cnc", devices["cnc"])
+    bringup.add("home", _home, "cnc")
+    if ENABLE_WASH:
+        bringup.add("pump", _open_pump)
+    bringup.add("worker", devices["worker"])
+    bringup.add("visco", _init_visco, "worker")
+
+    feed = archive = None
+    try:
+        if ENABLE_LIVE_FEED:
+            try:
+                feed = LiveFeed(results_root, port=LIVE_PORT)
+                feed.start()
+            except OSError as e:
+                print(f"[LIVE WARN] dashboard feed disabled: {e}")
+                feed = None
+        client = bringup.get("worker")
+        if feed is not None:
+            client.listeners.append(feed.publish)
+        if ENABLE_RAW_ARCHIVE:
+            # one archive per journal run, so --resume keeps appending to the same one
+            run_id = int(journal.run_config()["ts"])
+            archive = RawArchive(results_root / ARCHIVE_DIR / f"run_{run_id}", compress=RAW_ARCHIVE_COMPRESS,
+                                 meta={"spindle_k": SPINDLE_K, "mode": ANALYSIS_MODE, "rack": SAMPLE_RACK})
+            client.listeners.append(archive.append_packet)
+            if feed is not None:
+                feed.archive = archive
+        cnc = bringup.get("home")
+        bringup.get("visco")
+        print(bringup.report())  # the pump may still be booting: its time is reported when the first wash gets it
+        pump_ready = []
+
+        def _pump():
+            # first wash waits on the pump, so the ESP32 boot never gates measuring
+            if not pump_ready:
+                pump_ready.append(bringup.get("pump"))
+                print(bringup.report("pump"))
+            return pump_ready[0]
+
+        # A sample left mid-way means the spindle may be dirty: wash before anything else
+        interrupted = [i for i in samples if i in progress and progress[i] not in done_states | {"requeued"}]
+        if interrupted and ENABLE_WASH:
+            print(f"[RESUME] previous run stopped in sample {interrupted[-1]} ({progress[interrupted[-1]]}); re-washing spindle")
+            _wash_sequence(cnc, _pump())
+            for i in interrupted:
+                if progress[i] in finished:
+                    journal.record(i, "washed")
+                    progress[i] = "washed"
+
+        baseline = WASH_BASELINE_PCT
+        if ADAPTIVE_WASH and ENABLE_WASH and baseline is None:
+            baseline = calibrate_wash_baseline(cnc, client)
+
+        # Last valid viscosity of the current sample selects its wash policy
+        last_visc = {"cp": None}
+        def _remember_viscosity(pkt, rpm):
+            if pkt and pkt.get("viscosity_cp") is not None:
+                last_visc["cp"] = pkt["viscosity_cp"]
+        client.listeners.append(_remember_viscosity)
+
+        qc = QCMonitor(spindle_k=SPINDLE_K) if ENABLE_QC else None
+        queue = deque(i for i in samples if progress.get(i) not in done_states)
+        requeued, attempts = set(), {}
+        while queue:
+            i = queue.popleft()
+            if feed is not None:
+                feed.set_sample(i)
+            if archive is not None:
+                archive.set_sample(i)
             sample_dir = results_root / f"sample_{i:03d}"
             sample_dir.mkdir(parents=True, exist_ok=True)
             go_to_sample(cnc, rack=SAMPLE_RACK, idx=i, safe=True, wait_s=0)
-            time.sleep(PAUSE_AFTER_MOVE)
-
-            # Run the chosen viscometer analysis 
-            if ANALYSIS_MODE == "single":
-                csv_path = run_single_rpm(sample_dir, client)
-            elif ANALYSIS_MODE == "dynamic":
-                csv_path = run_dynamic_analysis(sample_dir, client)
-            elif ANALYSIS_MODE == "bisection":
-                csv_path = run_bisection(sample_dir, client)
-            else:
-                raise ValueError(f"Unknown ANALYSIS_MODE: {ANALYSIS_MODE}")
-            print(f"[sample {i}] results -> {csv_path}")
+            clock.sleep(PAUSE_AFTER_MOVE, "settle")
+            journal.record(i, "moved")
+            last_visc["cp"] = None
+
+            # Run the chosen viscometer analysis; QC may retry it at a lower speed, requeue or abort it
+            csv_path, outcome, rpm_scale, retried = None, None, 1.0, False
+            while outcome is None:
+                attempts[i] = attempts.get(i, 0) + 1
+                try:
+                    csv_path = _run_analysis(sample_dir, client, qc, rpm_scale)
+                    outcome = "pass"
+                except QCTrip as trip:
+                    client.stop()
+                    action = trip.action
+                    # each corrective action is tried once per sample; a second trip aborts
+                    if (action == "retry" and retried) or (action == "requeue" and i in requeued):
+                        action = "abort"
+                    print(f"[sample {i}] QC {trip.rule} -> {action}: {trip.detail} ({trip.saved_s:.0f}s saved)")
+                    log_qc(results_root, i, attempts[i], action, trip)
+                    journal.record(i, f"qc_{action}", rule=trip.rule, saved_s=trip.saved_s)
+                    if action == "retry":
+                        retried, rpm_scale = True, rpm_scale * trip.rpm_scale
+                    else:
+                        outcome = action
+            if outcome == "pass":
+                if qc is not None:
+                    log_qc(results_root, i, attempts[i], "pass")
+                journal.record(i, "measured")
+                fsync_file(csv_path)
+                journal.record(i, "written", csv=str(pathlib.Path(csv_path).relative_to(results_root)))
+                print(f"[sample {i}] results -> {csv_path}")
+            elif outcome == "requeue":
+                requeued.add(i)
+                queue.append(i)
+
+            if archive is not None:
+                archive.set_sample(None)  # wash-check packets are not part of the sample
 
             #wash sequence between samples 
-            if ENABLE_WASH and pump is not None:
-              wash1(cnc, pump)
-              wash2(cnc, pump) 
-              wash3(cnc, pump) 
+            if ENABLE_WASH:
+                wash = _wash(cnc, _pump(), client, last_visc["cp"], baseline)
+                journal.record(i, "requeued" if outcome == "requeue" else "washed", wash=wash)
+            elif outcome == "requeue":
+                journal.record(i, "requeued")
 
         cnc.home()
 
+        if ANALYSIS_MODE in FIT_PATTERNS and SHEAR_RATE_K:
+            fit_campaign(results_root, spindle_k=SPINDLE_K, src=SHEAR_RATE_K, pattern=FIT_PATTERNS[ANALYSIS_MODE])
+
     finally:
-        try:
-            client.stop()
-        except Exception:
-            pass
-        client.close()
+        client = bringup.get_or_none("worker")
+        if client is not None:
+            try:
+                client.stop()
+            except Exception:
+                pass
+            client.close()
+        pump = bringup.get_or_none("pump")
         # Close pump if used
         if pump is not None:
             try:
                 pump.close()
             except Exception:
                 pass
+        if feed is not None:
+            try:
+                feed.stop()
+            except Exception:
+                pass
+        if archive is not None:
+            archive.close()
+        bringup.shutdown()
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Automated viscosity measurement run")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue the run in results/run_journal.jsonl, skipping completed samples")
+    main(resume=ap.parse_args().resume)
@@ -0,0 +1,89 @@
+# Rule-based measurement QC, evaluated on every packet while a sample is being acquired
+import csv, pathlib
+from typing import Any, Dict, Iterable, Optional
+import clock
+
+QC_GRACE_S       = 3.0          # spin-up time before the not-immersed rule is armed
+QC_CONSECUTIVE   = 3            # packets in a row a rule must fail before it fires
+QC_POLL_SEC      = 2.0          # packet interval used for QC while methods would otherwise just dwell
+# not_immersed: torque below what the thinnest expected sample gives at the current speed (capped at
+# NOT_IMMERSED_PCT). Where that is under TORQUE_FLOOR_PCT air and sample can't be told apart: not checked.
+NOT_IMMERSED_PCT = 0.5          # torque %, upper bound of the threshold at high speeds
+MIN_SAMPLE_CP    = 10.0         # thinnest sample the cell is expected to measure
+TORQUE_FLOOR_PCT = 0.05         # torque readings below this are within sensor noise
+TEMP_FAULT_BITS  = 0x08 | 0x10  # interpret_status: Temperature Probe Failure / Unplugged
+QC_LOG_NAME      = "qc_log.csv"
+
+# rule -> action: "abort" (skip sample), "retry" (re-run now at rpm * rpm_scale), "requeue" (measure again at the end)
+QC_RULES: Dict[str, Dict[str, Any]] = {
+    "not_immersed": {"action": "requeue"},
+    "over_range":   {"action": "retry", "rpm_scale": 0.5},
+    "temp_fault":   {"action": "abort"},
+}
+
+class QCTrip(Exception):
+    def __init__(self, rule: str, action: str, rpm: float, elapsed_s: float, saved_s: float,
+                 detail: str, rpm_scale: float = 1.0):
+        super().__init__(f"QC {rule} -> {action}: {detail}")
+        self.rule = rule
+        self.action = action
+        self.rpm = rpm
+        self.elapsed_s = elapsed_s
+        self.saved_s = saved_s
+        self.detail = detail
+        self.rpm_scale = rpm_scale
+
+class QCMonitor:
+    def __init__(self, rules: Dict[str, Dict[str, Any]] = QC_RULES, spindle_k: float = 992.47):
+        self.rules = rules
+        self.spindle_k = spindle_k
+        self.begin(0.0)
+
+    def begin(self, planned_s: float):
+        # Called by each analysis method with its planned duration, so a trip can report the time saved
+        self.t0 = clock.now()
+        self.planned_s = planned_s
+        self.fails = {rule: 0 for rule in self.rules}
+
+    def _failing(self, rule: str, pkt: Dict[str, Any], rpm: float, elapsed: float) -> Optional[str]:
+        tq = pkt.get("torque_percent")
+        if rule == "not_immersed":
+            limit = min(NOT_IMMERSED_PCT, MIN_SAMPLE_CP * rpm / self.spindle_k)
+            if (rpm > 0 and limit >= TORQUE_FLOOR_PCT and elapsed >= QC_GRACE_S and pkt.get("torque_valid")
+                    and tq is not None and tq < limit):
+                return f"torque {tq:.2f}% < {limit:.2f}% at {rpm:g} rpm"
+        elif rule == "over_range":
+            if not pkt.get("torque_valid") and tq is not None and tq > 100.0:
+                return f"torque {tq:.1f}% over range at {rpm:g} rpm"
+        elif rule == "temp_fault":
+            status = pkt.get("status") or 0
+            if status & TEMP_FAULT_BITS:
+                return f"status 0x{status:02X}"
+        return None
+
+    def check(self, pkt: Optional[Dict[str, Any]], rpm: float, ignore: Iterable[str] = ()):
+        # Raises QCTrip once a rule has failed QC_CONSECUTIVE packets in a row
+        if not pkt:
+            return
+        elapsed = clock.now() - self.t0
+        for rule, cfg in self.rules.items():
+            if rule in ignore:
+                continue
+            detail = self._failing(rule, pkt, rpm, elapsed)
+            self.fails[rule] = self.fails[rule] + 1 if detail else 0
+            if self.fails[rule] >= QC_CONSECUTIVE:
+                raise QCTrip(rule, cfg["action"], rpm, round(elapsed, 1),
+                             round(max(self.planned_s - elapsed, 0.0), 1), detail, cfg.get("rpm_scale", 1.0))
+
+def log_qc(results_root: pathlib.Path, sample: int, attempt: int, action: str, trip: Optional[QCTrip] = None):
+    # One row per measurement attempt, including clean passes
+    path = pathlib.Path(results_root) / QC_LOG_NAME
+    new = not path.exists()
+    with path.open("a", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        if new:
+            w.writerow(["sample", "attempt", "rule", "action", "rpm", "elapsed_s", "saved_s", "detail"])
+        if trip is None:
+            w.writerow([sample, attempt, "", action, "", "", 0.0, ""])
+        else:
+            w.writerow([sample, attempt, trip.rule, action, trip.rpm, trip.elapsed_s, trip.saved_s, trip.detail])
@@ -1,6 +1,7 @@
-import time, serial
+import serial
 from serial import SerialException
 from cnc_controller import CNC_Machine
+import clock
 
 MEASUREMENT_WAIT = 0
 WASH1_WAIT = 30
@@ -8,6 +9,20 @@ WASH2_WAIT = 30
 WASH3_WAIT = 30
 ESP32_BOOT_DELAY_S = 1.5
 
+# Adaptive wash: short spin in the final rinse, torque compared with a clean-solvent baseline
+RINSE_STATION      = 2
+WASH_CHECK_RPM     = 30.0
+WASH_CHECK_SECONDS = 5.0
+WASH_CLEAN_TOL_PCT = 0.3      # torque % above baseline still counted as clean
+# (upper viscosity cP, class); unknown viscosity (e.g. QC abort) is treated as "high"
+VISC_CLASSES = ((100.0, "low"), (5000.0, "medium"), (float("inf"), "high"))
+# min_stages run before the first check; max_extra full cycles are added while still dirty
+WASH_POLICIES = {
+    "low":    {"stages": (1, 2, 3), "min_stages": 1, "max_extra": 1},
+    "medium": {"stages": (1, 2, 3), "min_stages": 2, "max_extra": 1},
+    "high":   {"stages": (1, 2, 3), "min_stages": 3, "max_extra": 2},
+}
+
 class PumpESP32:
     def __init__(self, port: str, baud: int = 9600, virtual: bool = False):
         self.port = port
@@ -21,7 +36,7 @@ class PumpESP32:
             return
         try:
             self.ser = serial.Serial(self.port, self.baud, timeout=1)
-            time.sleep(ESP32_BOOT_DELAY_S)
+            clock.sleep(ESP32_BOOT_DELAY_S)
         except SerialException as e:
             print(f"[PUMP WARN] could not open {self.port}: {e}. Falling back to virtual.")
             self.virtual = True
@@ -42,7 +57,7 @@ def go_to_sample(cnc, rack: str, idx: int, safe: bool = True, wait_s=0):
     cnc.move_to_location(rack, idx, safe=safe)
     if wait_s > 0:
         print(f"[SAMPLE] Waiting {wait_s}s for measurement...")
-        time.sleep(wait_s)
+        clock.sleep(wait_s, "settle")
 
 def go_to_wash_station(cnc, station_idx: int, safe: bool = True):
     cnc.move_to_location("washing_station", station_idx, safe=safe)
@@ -51,16 +66,76 @@ def wash1(cnc, pump: PumpESP32):
     go_to_wash_station(cnc, 0, safe=True)
     print("[WASH1] start")
     pump.send_tag(b"1")
-    time.sleep(WASH1_WAIT)
+    clock.sleep(WASH1_WAIT, "wash")
 
 def wash2(cnc, pump: PumpESP32):
     go_to_wash_station(cnc, 1, safe=True)
     print("[WASH2] start")
     pump.send_tag(b"2")
-    time.sleep(WASH2_WAIT)
+    clock.sleep(WASH2_WAIT, "wash")
 
 def wash3(cnc, pump: PumpESP32):
     go_to_wash_station(cnc, 2, safe=True)
     print("[WASH3] start")
     pump.send_tag(b"3")
-    time.sleep(WASH3_WAIT)
+    clock.sleep(WASH3_WAIT, "wash")
+
+WASH_STAGES = {1: wash1, 2: wash2, 3: wash3}
+
+def viscosity_class(viscosity_cp) -> str:
+    if viscosity_cp is None:
+        return "high"
+    for upper, name in VISC_CLASSES:
+        if viscosity_cp < upper:
+            return name
+    return "high"
+
+def residual_torque(cnc, client):
+    # Spin briefly in the final rinse; returns torque % (None if no valid reading)
+    go_to_wash_station(cnc, RINSE_STATION, safe=True)
+    client.set_speed(WASH_CHECK_RPM)
+    clock.sleep(WASH_CHECK_SECONDS, "wash check")
+    try:
+        pkt = client.read_single(timeout=1.0)
+    except RuntimeError:
+        pkt = None
+    client.stop()
+    return pkt.get("torque_percent") if pkt and pkt.get("torque_valid") else None
+
+def calibrate_wash_baseline(cnc, client) -> float:
+    # Run with a clean spindle and fresh rinse solvent
+    baseline = residual_torque(cnc, client)
+    if baseline is None:
+        raise RuntimeError("wash baseline: no valid torque reading in the rinse station")
+    print(f"[WASH] clean-solvent baseline {baseline:.2f}% at {WASH_CHECK_RPM:g} rpm")
+    return baseline
+
+def adaptive_wash(cnc, pump: PumpESP32, client, viscosity_cp, baseline_pct: float) -> dict:
+    cls = viscosity_class(viscosity_cp)
+    policy = WASH_POLICIES[cls]
+    stages, checks = [], []
+
+    def _clean() -> bool:
+        tq = residual_torque(cnc, client)
+        checks.append(tq)
+        return tq is not None and tq - baseline_pct <= WASH_CLEAN_TOL_PCT
+
+    clean = False
+    for k, stage in enumerate(policy["stages"]):
+        WASH_STAGES[stage](cnc, pump)
+        stages.append(stage)
+        if k + 1 >= policy["min_stages"]:
+            clean = _clean()
+            if clean:
+                break
+    extra = 0
+    while not clean and extra < policy["max_extra"]:
+        for stage in policy["stages"]:
+            WASH_STAGES[stage](cnc, pump)
+            stages.append(stage)
+        extra += 1
+        clean = _clean()
+    print(f"[WASH] class={cls} stages={stages} residual={checks} clean={clean}")
+    if not clean:
+        print(f"[WASH WARN] spindle still above baseline after {extra} extra cycle(s)")
+    return {"class": cls, "stages": stages, "extra_cycles": extra, "residual_pct": checks, "clean": clean}
@@ -0,0 +1,189 @@
+# Append-only chunked columnar archive of raw packets: one .npy memmap per column per chunk, plus a time index
+import json, os, pathlib, shutil, threading
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+import clock
+
+ARCHIVE_DIR  = "raw_archive"
+INDEX_NAME   = "index.json"
+CHUNK_ROWS   = 65536        # rows per chunk file (~1.2 MB); memory use stays at one chunk's pages
+FLUSH_EVERY  = 1024         # rows between msyncs of the active chunk
+COLUMNS = (                 # name, dtype; t is seconds (clock.now()), NaN marks rows not written yet
+    ("t", "<f8"),
+    ("rpm", "<f4"),
+    ("sample", "<i2"),      # -1 outside a sample
+    ("record", "<u2"),
+    ("torque_raw", "<u2"),
+    ("temp_raw", "<u2"),
+    ("status", "u1"),
+)
+INVALID_16 = (0xFFFF, 0xFFFE, 0xFFFD)  # sentinels, as in ViscometerProtocol._INVALID_16
+
+class RawArchive:
+    # Single writer (the acquisition thread, via client.listeners); window() may be called from any thread.
+    # readonly=True opens an archive another process may still be writing, for analysis.
+    def __init__(self, path: pathlib.Path, chunk_rows: int = CHUNK_ROWS, compress: bool = False,
+                 meta: Optional[Dict[str, Any]] = None, readonly: bool = False):
+        self.path = pathlib.Path(path)
+        self.compress = compress
+        self.readonly = readonly
+        self.sample = -1
+        self._lock = threading.Lock()
+        self._cols: Optional[Dict[str, np.memmap]] = None
+        self._n = 0
+        index_path = self.path / INDEX_NAME
+        if readonly:
+            self.index = json.loads(index_path.read_text(encoding="utf-8"))
+            self.chunk_rows = self.index["chunk_rows"]
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        if index_path.exists():
+            self.index = json.loads(index_path.read_text(encoding="utf-8"))
+        else:
+            self.index = {"version": 1, "chunk_rows": chunk_rows, "columns": [list(c) for c in COLUMNS],
+                          "meta": meta or {}, "chunks": []}
+            self._write_index()
+        self.chunk_rows = self.index["chunk_rows"]
+        # Reopening after a crash: continue filling the last chunk if it was never sealed
+        if self.index["chunks"] and not self.index["chunks"][-1]["sealed"]:
+            self._open_active(self.index["chunks"][-1]["name"], create=False)
+
+    # Index (rewritten atomically: readers never see a half-written file)
+    def _write_index(self):
+        tmp = self.path / (INDEX_NAME + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path / INDEX_NAME)
+
+    # Writing
+    def _open_active(self, name: str, create: bool):
+        d = self.path / name
+        if create:
+            d.mkdir(exist_ok=True)
+            self._cols = {c: np.lib.format.open_memmap(d / f"{c}.npy", mode="w+", dtype=dt, shape=(self.chunk_rows,))
+                          for c, dt in COLUMNS}
+            self._cols["t"][:] = np.nan
+            self.index["chunks"].append({"name": name, "rows": 0, "t_min": None, "t_max": None,
+                                         "sealed": False, "compressed": False})
+            self._write_index()
+            self._n = 0
+        else:
+            self._cols = {c: np.load(d / f"{c}.npy", mmap_mode="r+") for c, _ in COLUMNS}
+            self._n = int(np.count_nonzero(~np.isnan(self._cols["t"])))
+
+    def set_sample(self, idx: Optional[int]):
+        self.sample = -1 if idx is None else idx
+
+    def append_packet(self, pkt: Optional[Dict[str, Any]], rpm: Optional[float] = None):
+        # Listener for ViscometerClient.listeners
+        if not pkt:
+            return
+        self.append(clock.now(), pkt.get("record_number"), pkt.get("torque_raw"), pkt.get("temp_raw"),
+                    pkt.get("status"), rpm)
+
+    def append(self, t: float, record, torque_raw, temp_raw, status, rpm=None):
+        if self.readonly:
+            raise RuntimeError(f"{self.path} is open read-only")
+        with self._lock:
+            if self._cols is None:
+                self._open_active(f"chunk_{len(self.index['chunks']):06d}", create=True)
+            c, i = self._cols, self._n
+            c["rpm"][i] = np.nan if rpm is None else rpm
+            c["sample"][i] = self.sample
+            c["record"][i] = record or 0
+            c["torque_raw"][i] = 0xFFFF if torque_raw is None else torque_raw
+            c["temp_raw"][i] = 0xFFFF if temp_raw is None else temp_raw
+            c["status"][i] = status or 0
+            c["t"][i] = t  # last: a row counts as written once its time is set
+            self._n = i + 1
+            if self._n == self.chunk_rows:
+                self._seal()
+            elif self._n % FLUSH_EVERY == 0:
+                for k, _ in COLUMNS[::-1]:  # t last, as for a single row
+                    c[k].flush()
+
+    def _seal(self):
+        entry = self.index["chunks"][-1]
+        cols, n = self._cols, self._n
+        for m in cols.values():
+            m.flush()
+        entry.update(rows=n, t_min=float(cols["t"][0]) if n else None,
+                     t_max=float(cols["t"][n - 1]) if n else None, sealed=True)
+        self._cols, self._n = None, 0
+        if self.compress and n:
+            d = self.path / entry["name"]
+            np.savez_compressed(self.path / f"{entry['name']}.npz", **{k: np.asarray(v[:n]) for k, v in cols.items()})
+            del cols
+            entry["compressed"] = True
+            self._write_index()
+            # a reader may still map the .npy files (Windows refuses to delete those); the index already points at the .npz
+            shutil.rmtree(d, ignore_errors=True)
+        else:
+            self._write_index()
+
+    def close(self):
+        # Seals the partly filled chunk (a reopened archive then starts a new one)
+        with self._lock:
+            if self._cols is not None:
+                self._seal()
+
+    # Reading
+    def _chunk(self, entry: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        if entry is self.index["chunks"][-1] and self._cols is not None:
+            return {k: v[:self._n] for k, v in self._cols.items()}  # active chunk, rows written so far
+        if entry["compressed"]:
+            with np.load(self.path / f"{entry['name']}.npz") as z:
+                return {k: z[k] for k in z.files}  # compressed chunks are decompressed, not mapped
+        d = self.path / entry["name"]
+        rows = entry["rows"] if entry["sealed"] else None
+        return {c: np.load(d / f"{c}.npy", mmap_mode="r")[:rows] for c, _ in COLUMNS}
+
+    def iter_window(self, t0: float = -np.inf, t1: float = np.inf) -> Iterator[Dict[str, np.ndarray]]:
+        # Per-chunk slices with t0 <= t <= t1; uncompressed chunks are memmap views (no copy)
+        if self.readonly:
+            self.index = json.loads((self.path / INDEX_NAME).read_text(encoding="utf-8"))  # pick up new seals
+        with self._lock:
+            chunks = list(self.index["chunks"])
+        for entry in chunks:
+            if entry["sealed"] and (entry["t_max"] is None or entry["t_max"] < t0 or entry["t_min"] > t1):
+                continue
+            cols = self._chunk(entry)
+            t = cols["t"]  # unwritten rows of another writer's active chunk are NaN, which sorts last
+            lo, hi = np.searchsorted(t, t0, "left"), np.searchsorted(t, t1, "right")
+            if hi > lo:
+                yield {k: v[lo:hi] for k, v in cols.items()}
+
+    def window(self, t0: float = -np.inf, t1: float = np.inf) -> Dict[str, np.ndarray]:
+        # Whole window as one set of columns (a view if it lies in one uncompressed chunk, else concatenated)
+        parts = list(self.iter_window(t0, t1))
+        if len(parts) == 1:
+            return parts[0]
+        return {c: np.concatenate([p[c] for p in parts]) if parts else np.empty(0, dt) for c, dt in COLUMNS}
+
+    def rows(self) -> int:
+        with self._lock:
+            return sum(e["rows"] for e in self.index["chunks"] if e["sealed"]) + self._n
+
+def to_physical(cols: Dict[str, np.ndarray], spindle_k: Optional[float] = None) -> Dict[str, np.ndarray]:
+    # Raw columns -> torque %, temperature °C and (with spindle_k) viscosity cP; invalid values are NaN.
+    # Same scaling and validity rules as ViscometerProtocol._sanitize_*.
+    tq_raw = cols["torque_raw"]
+    tq = tq_raw / 100.0
+    tq[np.isin(tq_raw, INVALID_16) | (tq > 100.0)] = np.nan
+    T_raw = cols["temp_raw"]
+    temp = T_raw / 100.0 - 100.0
+    temp[np.isin(T_raw, INVALID_16) | (temp < -50.0) | (temp > 200.0)] = np.nan
+    out = {"t": cols["t"], "rpm": cols["rpm"], "sample": cols["sample"],
+           "torque_percent": tq, "temperature_c": temp}
+    if spindle_k is not None:
+        rpm = cols["rpm"].astype("f8")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["viscosity_cp"] = np.where(rpm > 0, tq * spindle_k / rpm, np.nan)
+    return out
+
+def run_archives(results_root: pathlib.Path) -> List[pathlib.Path]:
+    # Archive folders of all runs under results/raw_archive, oldest first
+    root = pathlib.Path(results_root) / ARCHIVE_DIR
+    return sorted(p for p in root.glob("run_*") if (p / INDEX_NAME).exists()) if root.exists() else []
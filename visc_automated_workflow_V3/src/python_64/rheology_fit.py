@@ -0,0 +1,195 @@
+# Batch rheology model fitting over the flow curves written by the analysis methods
+#   python rheology_fit.py --src 0.93 --spindle-k 992.47 [--results ../../results] [--workers 4]
+import argparse, csv, os, pathlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from scipy.optimize import curve_fit
+
+HB_N_GRID    = np.linspace(0.05, 2.0, 196)   # flow indices scanned by the linearised Herschel-Bulkley fit
+MIN_POINTS   = {"newtonian": 1, "power_law": 2, "herschel_bulkley": 3, "cross": 4}
+CROSS_MIN_SPAN = 10.0   # max/min shear rate needed before eta0/eta_inf are identifiable
+FIT_PATTERN  = "sample_*/dynamic_analysis.csv"
+SUMMARY_NAME = "rheology_fits.csv"
+MODELS       = ("newtonian", "power_law", "herschel_bulkley", "cross")
+PARAMS       = ("mu", "K", "n", "tau0", "eta0", "eta_inf", "lam", "m")
+# Units: shear rate 1/s, stress Pa, mu/eta0/eta_inf Pa.s, K Pa.s^n, tau0 Pa, lam s
+# spindle_k: cP per (torque % / rpm), the SPINDLE_K main.py sends to the worker.
+# src: shear rate per rpm (1/s per rpm) of the spindle/chamber (Brookfield SRC); there is no generic default.
+
+# Conversions
+def to_shear(rpm, torque_pct, spindle_k: float, src: float):
+    # viscosity_cp = torque% * K / rpm and gamma = SRC * rpm, so tau = eta * gamma = torque% * K * SRC / 1000
+    rpm = np.asarray(rpm, dtype=float)
+    torque_pct = np.asarray(torque_pct, dtype=float)
+    return src * rpm, torque_pct * spindle_k * src * 1e-3
+
+def load_flow_curve(path: pathlib.Path) -> Tuple[np.ndarray, np.ndarray]:
+    # rpm and torque % of the valid rows of a results CSV
+    rpm, tq = [], []
+    with pathlib.Path(path).open(newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(line for line in f if not line.startswith("#")):  # ramp_sweep.csv has # rows
+            if r.get("torque_valid") == "False" or r.get("torque_percent") in (None, "") or not r.get("rpm"):
+                continue
+            if float(r["rpm"]) > 0:
+                rpm.append(float(r["rpm"]))
+                tq.append(float(r["torque_percent"]))
+    return np.array(rpm), np.array(tq)
+
+def _pack(curves: List[Tuple[np.ndarray, np.ndarray]]):
+    # Ragged curves -> (S x P) arrays; padding has weight 0 and log-safe values
+    S, P = len(curves), max((len(g) for g, _ in curves), default=0)
+    G, T, w = np.ones((S, P)), np.ones((S, P)), np.zeros((S, P))
+    for i, (g, t) in enumerate(curves):
+        G[i, :len(g)], T[i, :len(t)], w[i, :len(g)] = g, t, 1.0
+    return G, T, w
+
+# Linear (vectorised) fits
+def fit_newtonian(G, T, w):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {"mu": (w * G * T).sum(1) / (w * G * G).sum(1)}
+
+def fit_power_law(G, T, w):
+    # ln tau = ln K + n ln gamma
+    w = w * (T > 0)
+    x, y = np.log(G), np.log(np.where(T > 0, T, 1.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        nw = w.sum(1)
+        xm, ym = (w * x).sum(1) / nw, (w * y).sum(1) / nw
+        dx = x - xm[:, None]
+        n = (w * dx * (y - ym[:, None])).sum(1) / (w * dx * dx).sum(1)
+        return {"K": np.exp(ym - n * xm), "n": n}
+
+def fit_herschel_bulkley_grid(G, T, w, n_grid: np.ndarray = HB_N_GRID):
+    # tau = tau0 + K gamma^n is linear in (tau0, K) for fixed n: solve all samples x all n at once
+    X = G[:, None, :] ** n_grid[None, :, None]
+    T3, w3 = T[:, None, :], w[:, None, :]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        nw = w3.sum(2, keepdims=True)
+        Xm, Tm = (w3 * X).sum(2, keepdims=True) / nw, (w3 * T3).sum(2, keepdims=True) / nw
+        K = (w3 * (X - Xm) * (T3 - Tm)).sum(2) / (w3 * (X - Xm) ** 2).sum(2)
+        tau0 = Tm[..., 0] - K * Xm[..., 0]
+        # negative yield stress is unphysical: fall back to a fit through the origin
+        K0 = (w3 * X * T3).sum(2) / (w3 * X * X).sum(2)
+        K, tau0 = np.where(tau0 < 0, K0, K), np.where(tau0 < 0, 0.0, tau0)
+        sse = (w3 * (T3 - tau0[..., None] - K[..., None] * X) ** 2).sum(2)
+    sse = np.where(np.isfinite(sse) & (K >= 0), sse, np.inf)
+    best = sse.argmin(1)
+    rows = np.arange(len(G))
+    return {"tau0": tau0[rows, best], "K": K[rows, best], "n": n_grid[best]}
+
+# Nonlinear refinement (runs in worker processes)
+def _hb(g, tau0, K, n):
+    return tau0 + K * g ** n
+
+def _cross(g, eta0, eta_inf, lam, m):
+    return g * (eta_inf + (eta0 - eta_inf) / (1.0 + (lam * g) ** m))
+
+def _refine(job):
+    # -> {model: (params, status)}
+    g, tau, hb_seed, pl_seed = job
+    out = {"herschel_bulkley": (tuple(hb_seed), "ok (linearised)"), "cross": ((np.nan,) * 4, "")}
+    if len(g) < MIN_POINTS["herschel_bulkley"]:
+        out["herschel_bulkley"] = (tuple(hb_seed), "")
+    elif np.all(np.isfinite(hb_seed)):
+        try:
+            p, _ = curve_fit(_hb, g, tau, p0=hb_seed, bounds=([0, 0, 0.01], [np.inf, np.inf, 3.0]), maxfev=2000)
+            out["herschel_bulkley"] = (tuple(p), "ok")
+        except (RuntimeError, ValueError) as e:
+            out["herschel_bulkley"] = (tuple(hb_seed), f"ok (linearised; refine failed: {e})")
+
+    span = g.max() / g.min() if len(g) else 0.0
+    if len(g) < MIN_POINTS["cross"]:
+        return out
+    if span < CROSS_MIN_SPAN:
+        out["cross"] = ((np.nan,) * 4, f"skipped: shear-rate span {span:.2g}x < {CROSS_MIN_SPAN:g}x")
+        return out
+    # Start from the power-law slope: in the thinning region eta ~ eta0 (lam g)^-m with m ~ 1 - n
+    eta = tau / g
+    n = pl_seed if np.isfinite(pl_seed) else 1.0
+    m0 = float(np.clip(1.0 - n, 0.1, 1.5))
+    g_mid = float(np.sqrt(g.min() * g.max()))
+    p0 = (2.0 * eta.max(), 0.1 * eta.min(), 1.0 / g.min(), m0)
+    try:
+        p, _ = curve_fit(_cross, g, tau, p0=p0, bounds=([0, 0, 0, 0.05], [np.inf, np.inf, np.inf, 3.0]),
+                         x_scale=(eta.max(), eta.min() + 1e-12, 1.0 / g_mid, 1.0), maxfev=2000)
+        out["cross"] = (tuple(p), "ok")
+    except (RuntimeError, ValueError) as e:
+        out["cross"] = ((np.nan,) * 4, f"fit failed: {e}")
+    return out
+
+def _goodness(T, pred, w):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        nw = w.sum(1)
+        ss_res = (w * (T - pred) ** 2).sum(1)
+        tm = (w * T).sum(1) / nw
+        ss_tot = (w * (T - tm[:, None]) ** 2).sum(1)
+        return 1.0 - ss_res / ss_tot, np.sqrt(ss_res / nw)
+
+# Campaign
+def fit_curves(curves: List[Tuple[np.ndarray, np.ndarray]], workers: Optional[int] = None) -> Dict[str, Dict[str, np.ndarray]]:
+    # curves are (shear_rate, shear_stress) pairs; returns model -> param/goodness arrays (one entry per curve).
+    # workers=0 keeps the nonlinear fits in-process; on Windows call this under an `if __name__ == "__main__"` guard.
+    G, T, w = _pack(curves)
+    fits = {"newtonian": fit_newtonian(G, T, w), "power_law": fit_power_law(G, T, w)}
+    hb = fit_herschel_bulkley_grid(G, T, w)
+
+    jobs = [(g, t, (hb["tau0"][i], hb["K"][i], hb["n"][i]), fits["power_law"]["n"][i]) for i, (g, t) in enumerate(curves)]
+    if workers == 0 or len(jobs) < 2:
+        refined = [_refine(j) for j in jobs]
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            refined = list(pool.map(_refine, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+    fits["herschel_bulkley"] = dict(zip(("tau0", "K", "n"), np.array([r["herschel_bulkley"][0] for r in refined]).reshape(-1, 3).T))
+    fits["cross"] = dict(zip(("eta0", "eta_inf", "lam", "m"), np.array([r["cross"][0] for r in refined]).reshape(-1, 4).T))
+
+    preds = {
+        "newtonian": fits["newtonian"]["mu"][:, None] * G,
+        "power_law": fits["power_law"]["K"][:, None] * G ** fits["power_law"]["n"][:, None],
+        "herschel_bulkley": _hb(G, *(fits["herschel_bulkley"][k][:, None] for k in ("tau0", "K", "n"))),
+        "cross": _cross(G, *(fits["cross"][k][:, None] for k in ("eta0", "eta_inf", "lam", "m"))),
+    }
+    counts = w.sum(1)
+    for model in MODELS:
+        fits[model]["r2"], fits[model]["rmse"] = _goodness(T, preds[model], w)
+        short = counts < MIN_POINTS[model]
+        for k in list(fits[model]):
+            fits[model][k] = np.where(short, np.nan, fits[model][k])
+        status = [r[model][1] if model in r else "ok" for r in refined]
+        fits[model]["status"] = [f"too few points ({int(c)} < {MIN_POINTS[model]})" if sh else st
+                                 for c, sh, st in zip(counts, short, status)]
+    return fits
+
+def fit_campaign(results_root: pathlib.Path, *, spindle_k: float, src: float, pattern: str = FIT_PATTERN,
+                 out_name: str = SUMMARY_NAME, workers: Optional[int] = None) -> pathlib.Path:
+    # Fit every flow curve under results_root and write one summary CSV (one row per sample and model)
+    results_root = pathlib.Path(results_root)
+    paths = sorted(results_root.glob(pattern))
+    raw = [load_flow_curve(p) for p in paths]
+    fits = fit_curves([to_shear(rpm, tq, spindle_k, src) for rpm, tq in raw], workers=workers)
+
+    out = results_root / out_name
+    with out.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["# spindle_k", spindle_k, "src_per_rpm", src])
+        w.writerow(["sample", "file", "model", "n_points", *PARAMS, "r2", "rmse_pa", "status"])
+        for i, p in enumerate(paths):
+            for model in MODELS:
+                vals = [fits[model].get(k, np.full(len(paths), np.nan))[i] for k in PARAMS]
+                w.writerow([p.parent.name, p.name, model, len(raw[i][0]),
+                            *("" if np.isnan(v) else f"{v:.6g}" for v in vals),
+                            *("" if np.isnan(fits[model][k][i]) else f"{fits[model][k][i]:.6g}" for k in ("r2", "rmse")),
+                            fits[model]["status"][i]])
+    print(f"[FIT] {len(paths)} flow curves -> {out}")
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fit rheology models to every flow curve under a results folder")
+    ap.add_argument("--src", type=float, required=True, help="spindle shear rate per rpm (1/s per rpm)")
+    ap.add_argument("--spindle-k", type=float, required=True, help="spindle constant, cP per (torque %% / rpm)")
+    ap.add_argument("--results", type=pathlib.Path, default=pathlib.Path(__file__).resolve().parents[2] / "results")
+    ap.add_argument("--pattern", default=FIT_PATTERN)
+    ap.add_argument("--workers", type=int, default=None, help="process pool size; 0 fits in-process")
+    args = ap.parse_args()
+    fit_campaign(args.results, spindle_k=args.spindle_k, src=args.src, pattern=args.pattern, workers=args.workers)
@@ -0,0 +1,54 @@
+# Durable run journal (JSON lines, fsync'd per entry) so interrupted campaigns can be resumed
+import json, os, pathlib
+from typing import Any, Dict, List, Optional
+import clock
+
+JOURNAL_NAME = "run_journal.jsonl"
+# Per-sample states, in the order a sample goes through them
+SAMPLE_STATES = ("moved", "measured", "written", "washed")
+
+class RunJournal:
+    def __init__(self, results_root: pathlib.Path):
+        self.path = pathlib.Path(results_root) / JOURNAL_NAME
+
+    def record(self, sample: Optional[int], state: str, **extra: Any):
+        entry = {"ts": round(clock.now(), 3), "sample": sample, "state": state, **extra}
+        line = json.dumps(entry) + "\n"
+        with self.path.open("a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    line = "\n" + line  # previous run died mid-write: don't glue onto the torn line
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self) -> List[Dict[str, Any]]:
+        # Entries of the latest run (everything after the last run_start); a torn last line is ignored
+        if not self.path.exists():
+            return []
+        out = []
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("state") == "run_start":
+                    out = []
+                out.append(entry)
+        return out
+
+    def progress(self) -> Dict[int, str]:
+        # Last recorded state of each sample in the latest run
+        return {e["sample"]: e["state"] for e in self.entries() if e.get("sample") is not None}
+
+    def run_config(self) -> Optional[Dict[str, Any]]:
+        entries = self.entries()
+        return entries[0] if entries and entries[0].get("state") == "run_start" else None
+
+def fsync_file(path: pathlib.Path):
+    # Make a results file durable before the journal says it was written
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
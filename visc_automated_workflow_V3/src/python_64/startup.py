@@ -0,0 +1,60 @@
+# Concurrent device bring-up: independent tasks start together, callers wait only on what they need
+import clock
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+class Bringup:
+    def __init__(self, max_workers: int = 8):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bringup")
+        self._futures: Dict[str, Future] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}  # name -> (start, end) seconds since t0
+        self._ends: Dict[str, float] = {}
+        self.t0 = clock.now()
+
+    def add(self, name: str, fn: Callable[..., Any], *deps: str):
+        # fn receives the results of deps, in order, and starts as soon as they are done
+        dep_futures = [self._futures[d] for d in deps]
+        submitted = clock.now()
+
+        def _run():
+            args = [f.result() for f in dep_futures]
+            # under a virtual clock the pool thread's timeline starts when the task could really start
+            clock.resume_at(max([submitted] + [self._ends[d] for d in deps]))
+            start = clock.now()
+            try:
+                return fn(*args)
+            finally:
+                self._ends[name] = clock.now()
+                self.timings[name] = (start - self.t0, self._ends[name] - self.t0)
+
+        self._futures[name] = self._pool.submit(_run)
+
+    def get(self, name: str) -> Any:
+        # Blocks until the task is done; re-raises its exception
+        result = self._futures[name].result()
+        clock.advance_to(self._ends[name])
+        return result
+
+    def get_or_none(self, name: str) -> Optional[Any]:
+        # For teardown: whatever came up, or None if the task is unknown or failed
+        f = self._futures.get(name)
+        if f is None:
+            return None
+        try:
+            return f.result()
+        except Exception:
+            return None
+
+    def report(self, *names: str) -> str:
+        # All tasks by default; pass names to report tasks that finished after an earlier report
+        parts = []
+        for name in names or self._futures:
+            if name in self.timings:
+                start, end = self.timings[name]
+                parts.append(f"{name} {end - start:.2f}s (+{start:.2f}s)")
+            else:
+                parts.append(f"{name} pending")
+        return f"[STARTUP] {clock.now() - self.t0:.2f}s: " + ", ".join(parts)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
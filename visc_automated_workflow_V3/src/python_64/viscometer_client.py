@@ -1,5 +1,6 @@
 # 64-bit client for the 32-bit worker (JSON-lines over subprocess)
 import json, subprocess, threading, queue, time, uuid, pathlib
+from collections import deque
 from typing import Any, Dict, Optional
 
 class ViscometerClient:
@@ -14,12 +15,23 @@ class ViscometerClient:
             cwd=str(worker_path.parent),
         )
         self.q = queue.Queue()
+        self.rpm = 0.0
+        self.listeners = []  # callables fn(pkt, rpm), fed every packet from read_single
+        self.stderr_tail = deque(maxlen=200)  # last worker stderr lines; drained so the pipe never fills
         threading.Thread(target=self._pump, daemon=True).start()
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
 
     def _pump(self):
         for line in self.proc.stdout:
             self.q.put(line)
 
+    def _drain_stderr(self):
+        for line in self.proc.stderr:
+            self.stderr_tail.append(line.rstrip())
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
     def req(self, cmd: str, timeout_s: float = 60, **kwargs) -> Dict[str, Any]:
         rid = str(uuid.uuid4())
         payload = {"id": rid, "cmd": cmd, **kwargs}
@@ -30,6 +42,8 @@ class ViscometerClient:
             try:
                 resp = json.loads(self.q.get(timeout=0.25))
             except queue.Empty:
+                if not self.alive():
+                    raise ConnectionError(f"{cmd}: worker exited with code {self.proc.returncode}")
                 continue
             if resp.get("id") == rid:
                 if not resp.get("ok"):
@@ -41,8 +55,11 @@ class ViscometerClient:
     def init(self, *, port: str, baud: int, timeout: float = 1.0, spindle_k: float = 992.47):
         return self.req("init", timeout_s=10, port=port, baud=baud, timeout=timeout, spindle_k=spindle_k)
 
-    def status(self):
-        return self.req("status", timeout_s=5)
+    def warm(self):
+        return self.req("warm", timeout_s=30)
+
+    def status(self, timeout_s: float = 5):
+        return self.req("status", timeout_s=timeout_s)
 
     def identify(self):
         return self.req("identify", timeout_s=5)
@@ -51,13 +68,23 @@ class ViscometerClient:
         return self.req("zero", timeout_s=5)
 
     def set_speed(self, rpm: float):
-        return self.req("set_speed", timeout_s=5, rpm=rpm)
+        data = self.req("set_speed", timeout_s=5, rpm=rpm)
+        self.rpm = float(rpm)
+        return data
 
     def read_single(self, timeout: float = 1.0):
-        return self.req("read_single", timeout_s=5, timeout=timeout)
+        pkt = self.req("read_single", timeout_s=5, timeout=timeout)
+        for fn in self.listeners:
+            try:
+                fn(pkt, self.rpm)
+            except Exception:
+                pass
+        return pkt
 
     def stop(self):
-        return self.req("stop", timeout_s=5)
+        data = self.req("stop", timeout_s=5)
+        self.rpm = 0.0
+        return data
 
     def close(self):
         try:
@@ -65,3 +92,11 @@ class ViscometerClient:
         except Exception:
             pass
         self.proc.terminate()
+
+    def kill(self):
+        # Hard stop for a hung worker; releases the serial port it holds
+        self.proc.kill()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
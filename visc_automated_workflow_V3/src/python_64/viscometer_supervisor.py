@@ -0,0 +1,139 @@
+# Supervisor around the 32-bit worker: status pings, warm standby process and automatic failover
+import pathlib, threading, time
+from typing import Any, Dict, Optional
+from viscometer_client import ViscometerClient
+
+HEALTH_PERIOD_S  = 5.0    # idle interval between status pings
+HEALTH_TIMEOUT_S = 2.0    # a status ping slower than this marks the worker unhealthy
+STANDBY_WAIT_S   = 60.0   # how long a failover waits for the standby to finish spawning
+
+class SupervisedViscometer:
+    # Same call surface as ViscometerClient; worker faults (timeouts, dead process, broken pipe)
+    # trigger a failover to the standby and one retry. Device errors (RuntimeError) pass through.
+    def __init__(self, py32_path: str, worker_path: pathlib.Path, standby: bool = True):
+        self.py32_path = py32_path
+        self.worker_path = worker_path
+        self.use_standby = standby
+        self.listeners = []        # shared with every worker client, see ViscometerClient.listeners
+        self.rpm = 0.0
+        self.failovers = 0
+        self._init_kwargs: Optional[Dict[str, Any]] = None
+        self._lock = threading.RLock()
+        self._standby: Optional[ViscometerClient] = None
+        self._standby_ready = threading.Event()
+        self._closed = False
+        self.client = self._spawn()
+        if standby:
+            self._spawn_standby()
+        threading.Thread(target=self._watchdog, daemon=True).start()
+
+    # Worker processes
+    def _spawn(self) -> ViscometerClient:
+        c = ViscometerClient(self.py32_path, self.worker_path)
+        c.listeners = self.listeners
+        return c
+
+    def _spawn_standby(self):
+        self._standby_ready.clear()
+
+        def _run():
+            c = self._spawn()
+            try:
+                c.warm()  # imports + DLL load happen now, not during failover
+            except Exception as e:
+                print(f"[VISCO WARN] standby warm-up failed: {str(e).split(' | ')[0]}")
+            self._standby = c
+            self._standby_ready.set()
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def _failover(self, reason: str):
+        t0 = time.time()
+        old = self.client
+        print(f"[VISCO] worker unhealthy ({reason}); failing over")
+        for line in list(old.stderr_tail)[-5:]:
+            print(f"[VISCO stderr] {line}")
+        old.kill()  # frees the serial port before the standby opens it
+
+        if self.use_standby:
+            if not self._standby_ready.wait(timeout=STANDBY_WAIT_S):
+                raise RuntimeError("failover failed: standby worker not ready")
+            self.client, self._standby = self._standby, None
+            self._spawn_standby()
+        else:
+            self.client = self._spawn()
+
+        # Only the serial reconnect is repeated; restore the spindle if it was turning
+        reinit = None
+        if self._init_kwargs is not None:
+            reinit = self.client.init(**self._init_kwargs)
+            if self.rpm > 0:
+                self.client.set_speed(self.rpm)
+        self.failovers += 1
+        print(f"[VISCO] failover #{self.failovers} done in {time.time() - t0:.2f}s")
+        return reinit
+
+    def _call(self, name: str, *args, **kwargs):
+        with self._lock:
+            try:
+                return getattr(self.client, name)(*args, **kwargs)
+            except OSError as e:  # TimeoutError, ConnectionError, BrokenPipeError
+                reinit = self._failover(f"{name}: {e}")
+                if name == "init":  # the failover has just re-run init on the new worker
+                    return reinit
+                return getattr(self.client, name)(*args, **kwargs)
+
+    def _watchdog(self):
+        while not self._closed:
+            time.sleep(HEALTH_PERIOD_S)
+            # a request in flight is its own health check, so never queue behind it
+            if self._closed or not self._lock.acquire(blocking=False):
+                continue
+            try:
+                self.client.status(timeout_s=HEALTH_TIMEOUT_S)
+                if self.use_standby and self._standby is not None and not self._standby.alive():
+                    self._standby = None
+                    self._spawn_standby()
+            except OSError as e:
+                try:
+                    self._failover(f"health check: {e}")
+                except Exception as e2:
+                    print(f"[VISCO WARN] failover from watchdog failed: {e2}")
+            finally:
+                self._lock.release()
+
+    # ViscometerClient surface
+    def init(self, *, port: str, baud: int, timeout: float = 1.0, spindle_k: float = 992.47):
+        self._init_kwargs = {"port": port, "baud": baud, "timeout": timeout, "spindle_k": spindle_k}
+        return self._call("init", **self._init_kwargs)
+
+    def status(self):
+        return self._call("status")
+
+    def identify(self):
+        return self._call("identify")
+
+    def zero(self):
+        return self._call("zero")
+
+    def set_speed(self, rpm: float):
+        data = self._call("set_speed", rpm)
+        self.rpm = float(rpm)
+        return data
+
+    def read_single(self, timeout: float = 1.0):
+        return self._call("read_single", timeout=timeout)
+
+    def stop(self):
+        data = self._call("stop")
+        self.rpm = 0.0
+        return data
+
+    def close(self):
+        self._closed = True
+        if self.use_standby:
+            self._standby_ready.wait(timeout=STANDBY_WAIT_S)  # don't orphan a standby still spawning
+        with self._lock:
+            self.client.close()
+            if self._standby is not None:
+                self._standby.close()